@@ -0,0 +1,333 @@
+"""
+micro-benchmarks for validino.
+
+Times each public validator in validino.base, validino.extra and
+validino.ccvalidate on an input that passes and on one that fails
+(catching the Invalid raised, as callers do), along with the
+combinators, Schema, the message lookup, and Invalid.unpack_errors()
+on deep and wide error trees.
+
+    python bench/micro.py                   # run everything
+    python bench/micro.py -k schema -k ip   # only cases with these in their names
+    python bench/micro.py -o before.json    # save the results
+    python bench/micro.py -b before.json    # compare with saved results
+
+When comparing, cases that have slowed down by more than the
+threshold are flagged, and the exit status is 1 if there are any.
+"""
+
+import json
+import os
+import platform
+import sys
+import time
+import timeit
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..',
+                                'src'))
+
+import validino as V
+import validino.ccvalidate as cc
+from validino.base import _msg
+
+
+def _passes(v, value):
+    v(value)
+    return lambda: v(value)
+
+
+def _fails(v, value):
+    try:
+        v(value)
+    except V.Invalid:
+        pass
+    else:
+        raise AssertionError("%r accepted %r" % (v, value))
+    def run():
+        try:
+            v(value)
+        except V.Invalid:
+            pass
+    return run
+
+
+def _raises(func, value, exc):
+    def run():
+        try:
+            func(value)
+        except exc:
+            pass
+        else:
+            raise AssertionError("%r accepted %r" % (func, value))
+    run()
+    return run
+
+
+def _error_tree(depth, width):
+    """
+    returns an Invalid from a schema nested depth levels deep, with
+    width failing fields at each level.
+    """
+    validators=dict(('f%d' % i, V.not_empty('missing')) for i in range(width))
+    for i in range(depth):
+        validators=dict(validators, child=V.Schema(validators))
+    try:
+        V.Schema(validators)({})
+    except V.Invalid, e:
+        return e
+    raise AssertionError("schema accepted empty data")
+
+
+def base_cases():
+    """
+    cases for validino.base.
+    """
+    yield 'confirm_type', _passes(V.confirm_type(int), 3), \
+                          _fails(V.confirm_type(int), 'x')
+    yield 'translate', _passes(V.translate({'a' : 1}), 'a'), \
+                       _fails(V.translate({'a' : 1}), 'b')
+    yield 'to_unicode', _passes(V.to_unicode(), 'abc'), \
+                        _fails(V.to_unicode(), '\xff')
+    yield 'is_scalar', _passes(V.is_scalar(), 1), \
+                       _fails(V.is_scalar(), [1])
+    yield 'is_list', _passes(V.is_list(), [1]), \
+                     _fails(V.is_list(), 1)
+    yield 'to_scalar', _passes(V.to_scalar(), [1]), None
+    yield 'to_list', _passes(V.to_list(), 1), None
+    yield 'default', _passes(V.default('x'), None), None
+    v=V.either(V.empty(), V.integer())
+    yield 'either', _passes(v, '3'), _fails(v, 'x')
+    v=V.compose(V.strip, V.not_empty(), V.integer())
+    yield 'compose', _passes(v, ' 3 '), _fails(v, '  ')
+    v=V.check(V.not_empty(), V.clamp_length(max=5))
+    yield 'check', _passes(v, 'abc'), _fails(v, 'abcdefg')
+    v=V.excursion(V.integer())
+    yield 'excursion', _passes(v, '3'), _fails(v, 'x')
+    yield 'equal', _passes(V.equal('a'), 'a'), _fails(V.equal('a'), 'b')
+    yield 'not_equal', _passes(V.not_equal('a'), 'b'), \
+                       _fails(V.not_equal('a'), 'a')
+    yield 'empty', _passes(V.empty(), ''), _fails(V.empty(), 'a')
+    yield 'not_empty', _passes(V.not_empty(), 'a'), \
+                       _fails(V.not_empty(), '')
+    yield 'strip', _passes(V.strip, ' a '), None
+    v=V.clamp(min=0, max=10)
+    yield 'clamp', _passes(v, 5), _fails(v, 11)
+    v=V.clamp_length(min=1, max=5)
+    yield 'clamp_length', _passes(v, 'abc'), _fails(v, 'abcdefg')
+    domain=['chicken', 'fish', 'monkey brains', 'soy meal']
+    yield 'belongs', _passes(V.belongs(domain), 'fish'), \
+                     _fails(V.belongs(domain), 'frog')
+    yield 'not_belongs', _passes(V.not_belongs(domain), 'frog'), \
+                         _fails(V.not_belongs(domain), 'fish')
+    v=V.parse_time('%H:%M')
+    yield 'parse_time', _passes(v, '12:30'), _fails(v, '25:00')
+    v=V.parse_date('%m/%d/%Y')
+    yield 'parse_date', _passes(v, '03/04/2007'), _fails(v, '02/30/2007')
+    v=V.parse_datetime('%Y-%m-%d %H:%M:%S')
+    yield 'parse_datetime', _passes(v, '2007-03-04 12:30:00'), \
+                            _fails(v, '2007-03-04 12:30')
+    yield 'integer', _passes(V.integer(), '42'), _fails(V.integer(), 'x')
+    v=V.regex(r'\d{3}-\d{4}$')
+    yield 'regex', _passes(v, '555-1234'), _fails(v, '555-12345')
+    yield 'regex_sub', _passes(V.regex_sub(r'\s+', ' '), 'a  b   c'), None
+    yield 'fields_equal', _passes(V.fields_equal(), ('a', 'a')), \
+                          _fails(V.fields_equal(), ('a', 'b'))
+    v=V.fields_match('a', 'b')
+    yield 'fields_match', _passes(v, dict(a=1, b=1)), \
+                          _fails(v, dict(a=1, b=2))
+    s=V.Schema(dict(name=(V.strip, V.not_empty()),
+                    age=(V.integer(), V.clamp(min=0, max=130)),
+                    state=V.belongs(domain)))
+    yield 'Schema', _passes(s, dict(name=' joe ', age='40', state='fish')), \
+                    _fails(s, dict(name='', age='x', state='frog'))
+    s=V.Schema({'email' : V.not_empty(),
+                'email_confirm' : V.not_empty(),
+                ('email', 'email_confirm') : V.fields_equal()})
+    yield 'Schema.plural', _passes(s, dict(email='a', email_confirm='a')), \
+                           _fails(s, dict(email='a', email_confirm='b'))
+    flat=dict(('a%d.b%d.c%d' % (i, i % 7, i % 3), i) for i in range(100))
+    nested=V.dict_nest(flat)
+    yield 'dict_nest', _passes(V.dict_nest, flat), None
+    yield 'dict_unnest', _passes(V.dict_unnest, nested), None
+    yield '_msg', lambda: _msg(None, 'integer', 'not an integer'), None
+    deep=_error_tree(8, 3)
+    yield 'Invalid.unpack_errors.deep', deep.unpack_errors, None
+    wide=_error_tree(2, 50)
+    yield 'Invalid.unpack_errors.wide', wide.unpack_errors, None
+
+
+def extra_cases():
+    """
+    cases for validino.extra.
+    """
+    v=V.email()
+    yield 'email', _passes(v, 'joe@example.com'), _fails(v, 'joe@')
+    v=V.credit_card()
+    yield 'credit_card', _passes(v, ('4111111111111111', cc.VISA)), \
+                         _fails(v, ('4111111111111112', cc.VISA))
+    yield 'ip', _passes(V.ip(), '192.168.1.10'), _fails(V.ip(), '192.168.1')
+    yield 'ipv6', _passes(V.ipv6(), '2001:db8::1'), _fails(V.ipv6(), '2001::db8::1')
+    yield 'ip_network', _passes(V.ip_network(), '10.0.0.0/8'), \
+                        _fails(V.ip_network(), '10.0.0.1/8')
+    networks=['10.0.0.0/8', '192.168.0.0/16', '2001:db8::/32']
+    yield 'ip_in', _passes(V.ip_in(networks), '192.168.3.4'), \
+                   _fails(V.ip_in(networks), '172.16.0.1')
+    yield 'ip_not_in', _passes(V.ip_not_in(networks), '172.16.0.1'), \
+                       _fails(V.ip_not_in(networks), '192.168.3.4')
+    yield 'url', _passes(V.url(), 'http://example.com/a?b=c'), \
+                 _fails(V.url(), 'gopher://example.com/')
+
+
+def ccvalidate_cases():
+    """
+    cases for validino.ccvalidate.
+    """
+    check=lambda ccnum: cc.check_credit_card(ccnum, cc.VISA)
+    yield 'check_credit_card', _passes(check, '4111-1111-1111-1111'), \
+          _raises(check, '4111-1111-1111-1112',
+                  cc.CreditCardValidationException)
+    yield 'prefix_for_ccnum', _passes(cc.prefix_for_ccnum, '4111111111111111'), \
+                              None
+    yield 'luhn_checksum', _passes(cc.luhn_checksum, '4111111111111111'), None
+    yield 'luhn_check_digit', _passes(cc.luhn_check_digit, '411111111111111'), \
+                              None
+    yield 'generate_cards.1000', \
+          lambda: list(cc.generate_cards(cc.VISA, count=1000)), None
+
+
+def all_cases():
+    """
+    returns a list of (name, function) pairs for every case.
+    """
+    cases=[]
+    for module, make in (('base', base_cases),
+                         ('extra', extra_cases),
+                         ('ccvalidate', ccvalidate_cases)):
+        for name, passing, failing in make():
+            if failing is None:
+                cases.append(('%s.%s' % (module, name), passing))
+            else:
+                cases.append(('%s.%s.pass' % (module, name), passing))
+                cases.append(('%s.%s.fail' % (module, name), failing))
+    return cases
+
+
+def measure(func, repeat=5, min_time=0.1):
+    """
+    times func, calling it often enough that each of repeat runs
+    takes at least min_time seconds, and returns the best and median
+    time per call in nanoseconds, and the number of calls per run.
+    """
+    timer=timeit.Timer(func)
+    number=1
+    while True:
+        t=timer.timeit(number)
+        if t >= min_time:
+            break
+        if t <= 0:
+            number*=10
+        else:
+            number=max(number * 2, int(number * min_time * 1.2 / t))
+    times=sorted([t] + timer.repeat(repeat - 1, number))
+    scale=1e9 / number
+    return times[0] * scale, times[len(times) // 2] * scale, number
+
+
+def run(cases, repeat, min_time, out=sys.stdout):
+    results={}
+    for name, func in cases:
+        best, median, number=measure(func, repeat, min_time)
+        results[name]=dict(best=best,
+                           median=median,
+                           number=number,
+                           repeat=repeat)
+        print >> out, "%-45s %12.1f ns %12.1f ns" % (name, best, median)
+    return results
+
+
+def compare(results, baseline, threshold, out=sys.stdout):
+    """
+    prints each case's best time against the baseline's, and returns
+    the names of those that have slowed down by more than threshold
+    (a fraction).
+    """
+    regressions=[]
+    print >> out
+    print >> out, "%-45s %12s %12s %8s" % ('case', 'baseline', 'now', 'ratio')
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        before=baseline[name]['best']
+        now=results[name]['best']
+        ratio=now / before
+        flag=''
+        if ratio > 1 + threshold:
+            flag='  SLOWER'
+            regressions.append(name)
+        elif ratio < 1 - threshold:
+            flag='  faster'
+        print >> out, "%-45s %9.1f ns %9.1f ns %7.2fx%s" % (name, before, now,
+                                                           ratio, flag)
+    return regressions
+
+
+def main(args=None):
+    parser=OptionParser(usage="%prog [options]")
+    parser.add_option('-k', dest='patterns', action='append', default=[],
+                      help="only run cases whose names contain PATTERN, "
+                           "ignoring case (may be repeated)", metavar='PATTERN')
+    parser.add_option('-l', '--list', action='store_true',
+                      help="list the cases and exit")
+    parser.add_option('-r', '--repeat', type='int', default=5,
+                      help="timing runs per case [%default]")
+    parser.add_option('-t', '--min-time', type='float', default=0.1,
+                      help="minimum seconds per timing run [%default]")
+    parser.add_option('-o', '--output', metavar='FILE',
+                      help="write the results to FILE as JSON")
+    parser.add_option('-b', '--baseline', metavar='FILE',
+                      help="compare with results saved in FILE")
+    parser.add_option('--threshold', type='float', default=0.1,
+                      help="slowdown, as a fraction, flagged as a "
+                           "regression [%default]")
+    options, args=parser.parse_args(args)
+    cases=all_cases()
+    if options.patterns:
+        patterns=[p.lower() for p in options.patterns]
+        cases=[(name, func) for name, func in cases
+               if [p for p in patterns if p in name.lower()]]
+    if options.list:
+        for name, func in cases:
+            print name
+        return 0
+    results=run(cases, options.repeat, options.min_time)
+    if options.output:
+        doc=dict(meta=dict(validino=V.__version__,
+                           python=platform.python_version(),
+                           implementation=platform.python_implementation(),
+                           platform=platform.platform(),
+                           time=time.strftime('%Y-%m-%dT%H:%M:%S')),
+                 results=results)
+        f=open(options.output, 'w')
+        try:
+            json.dump(doc, f, indent=1, sort_keys=True)
+        finally:
+            f.close()
+    if options.baseline:
+        f=open(options.baseline)
+        try:
+            baseline=json.load(f)['results']
+        finally:
+            f.close()
+        regressions=compare(results, baseline, options.threshold)
+        if regressions:
+            print
+            print "%d case(s) slower than the baseline by more than %d%%" \
+                  % (len(regressions), options.threshold * 100)
+            return 1
+    return 0
+
+
+if __name__=='__main__':
+    sys.exit(main())
@@ -0,0 +1,338 @@
+"""
+an end-to-end workload benchmark for validino.
+
+Validates a generated corpus of records, a mixture of valid and
+invalid ones, with whole schemas, as an application would: each
+record is passed to the schema, and the errors of invalid ones are
+unpacked.  Two schemas are run:
+
+  example    the schema in doc/example.py
+  synthetic  a schema of about 200 fields, with plural keys and nested
+             schemas, whose failures produce nested Invalid trees
+
+For each, the throughput, the median and 99th percentile latency per
+record and the peak memory used are reported.  Memory is measured in
+a separate pass over the first --memory-records records, run in a
+forked child process: the growth of the child's peak resident size
+over its size before validating.  Where there is no fork() or
+resource module, memory isn't reported.
+
+    python bench/workload.py                      # a million records each
+    python bench/workload.py -n 100000 -w example
+    python bench/workload.py -o workload.json
+"""
+
+import gc
+import json
+import os
+import platform
+import random
+import sys
+import time
+from array import array
+from optparse import OptionParser
+from timeit import default_timer
+
+try:
+    import resource
+except ImportError:
+    resource=None
+
+_here=os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(_here, '..', 'src'))
+sys.path.insert(0, os.path.join(_here, '..', 'doc'))
+
+import validino as V
+
+
+_words=['alpha', 'bravo', 'charlie', 'delta', 'echo', 'foxtrot', 'golf']
+
+
+def _name(rng):
+    return rng.choice(_words).capitalize()
+
+
+def _example_record(rng, invalid):
+    import example
+    email='%s@example.com' % rng.choice(_words)
+    rec=dict(spank_level=rng.choice(['', 'other', str(rng.randint(0, 50))]),
+             preference=rng.choice(['', 'fish', 'chicken', 'soy meal']),
+             honorific=rng.choice(['', 'Dr.', 'Ms.', 'Rear Admiral']),
+             firstname=' %s ' % _name(rng),
+             middlename=rng.choice(['', _name(rng)]),
+             lastname=_name(rng),
+             address1='%d %s St.' % (rng.randint(1, 999), _name(rng)),
+             address2=rng.choice(['', 'Apt. %d' % rng.randint(1, 20)]),
+             city=_name(rng),
+             state=rng.choice(example.VALID_STATES),
+             zip_code='%05d' % rng.randint(0, 99999),
+             zip_extension=rng.choice(['', '%04d' % rng.randint(0, 9999)]),
+             phone=rng.choice(['', '555-123-4567', '555/123-4567']),
+             email=email,
+             email_confirm=email,
+             comment=rng.choice(['', 'nice legs', 'x' * 150]))
+    if invalid:
+        bad=dict(spank_level='lots',
+                 preference='roadkill',
+                 firstname='   ',
+                 lastname='x' * 50,
+                 state='ZZ',
+                 zip_code='123456',
+                 phone='call me',
+                 email='nobody',
+                 email_confirm='somebody@example.com',
+                 comment='x' * 300)
+        for k in rng.sample(sorted(bad), rng.randint(1, 4)):
+            rec[k]=bad[k]
+    return rec
+
+
+def example_workload():
+    """
+    returns the doc/example.py schema and a function making records
+    for it.
+    """
+    import example
+    return example.schema, _example_record
+
+
+# (validator, good value, bad value) makers for the field kinds of
+# the synthetic schema
+_address=V.Schema(dict(street=(V.strip, V.not_empty()),
+                       city=(V.strip, V.not_empty(), V.clamp_length(max=30)),
+                       zip=(V.strip, V.regex(r'\d{5}$'))))
+
+_kinds=[
+    ((V.strip, V.not_empty(), V.clamp_length(max=40)),
+     lambda rng: ' %s ' % _name(rng),
+     lambda rng: rng.choice(['  ', 'x' * 41])),
+    (V.either(V.empty(), V.compose(V.integer(), V.clamp(min=0, max=1000))),
+     lambda rng: str(rng.randint(0, 1000)),
+     lambda rng: rng.choice(['many', '1001'])),
+    (V.belongs(_words),
+     lambda rng: rng.choice(_words),
+     lambda rng: 'hotel'),
+    ((V.strip, V.either(V.empty(), V.regex(r'\d{3}-\d{4}$'))),
+     lambda rng: rng.choice(['', '%03d-%04d' % (rng.randint(0, 999),
+                                                rng.randint(0, 9999))]),
+     lambda rng: '555-12345'),
+    (V.parse_date('%Y-%m-%d'),
+     lambda rng: '%04d-%02d-%02d' % (rng.randint(1950, 2010),
+                                     rng.randint(1, 12),
+                                     rng.randint(1, 28)),
+     lambda rng: rng.choice(['2007-02-30', '03/04/2007'])),
+    (V.email(),
+     lambda rng: '%s@example.com' % rng.choice(_words),
+     lambda rng: rng.choice(['nobody', 'a b@example.com'])),
+    (_address,
+     lambda rng: dict(street='%d Main St.' % rng.randint(1, 999),
+                      city=_name(rng),
+                      zip='%05d' % rng.randint(0, 99999)),
+     lambda rng: dict(street='', city='x' * 31, zip='1234')),
+    ((V.default(''), V.clamp_length(max=10)),
+     lambda rng: rng.choice([None, '', 'short']),
+     lambda rng: 'far too long'),
+    ]
+
+
+def synthetic_workload(nfields=200):
+    """
+    returns a schema of nfields fields, of the kinds above in turn,
+    where each email field has a confirmation field checked against
+    it with a plural key, and a function making records for it.
+    """
+    validators={}
+    fields=[]
+    for i in range(nfields):
+        name='f%03d' % i
+        v, good, bad=_kinds[i % len(_kinds)]
+        validators[name]=v
+        fields.append((name, good, bad))
+        if v is _kinds[5][0]:
+            confirm='%s_confirm' % name
+            validators[confirm]=V.not_empty()
+            validators[(name, confirm)]=V.fields_equal(field=confirm)
+    def make(rng, invalid):
+        rec={}
+        for name, good, bad in fields:
+            rec[name]=good(rng)
+            confirm='%s_confirm' % name
+            if confirm in validators:
+                rec[confirm]=rec[name]
+        if invalid:
+            for name, good, bad in rng.sample(fields, rng.randint(1, 5)):
+                rec[name]=bad(rng)
+        return rec
+    return V.Schema(validators), make
+
+
+def corpus(make, count, invalid_rate, seed):
+    """
+    returns a list of count records, of which about invalid_rate are
+    invalid.
+    """
+    rng=random.Random(seed)
+    return [make(rng, rng.random() < invalid_rate) for i in xrange(count)]
+
+
+def cycle(pool, count):
+    """
+    yields count records, cycling through the pregenerated ones in
+    pool so that generating them doesn't dominate the run.
+    """
+    n=len(pool)
+    for i in xrange(count):
+        yield pool[i % n]
+
+
+def validate(schema, data):
+    """
+    validates one record as an application would, returning whether
+    it was valid.
+    """
+    try:
+        schema(data)
+    except V.Invalid, e:
+        e.unpack_errors()
+        return False
+    return True
+
+
+def percentile(ordered, q):
+    if not ordered:
+        return 0.0
+    return ordered[int(round(q * (len(ordered) - 1)))]
+
+
+def run_timing(schema, records):
+    latencies=array('d')
+    invalid=0
+    timer=default_timer
+    gc.collect()
+    start=timer()
+    for data in records:
+        t=timer()
+        ok=validate(schema, data)
+        latencies.append(timer() - t)
+        if not ok:
+            invalid+=1
+    elapsed=timer() - start
+    ordered=sorted(latencies)
+    n=len(ordered)
+    return dict(records=n,
+                invalid=invalid,
+                seconds=elapsed,
+                records_per_sec=n / elapsed,
+                p50_us=percentile(ordered, 0.5) * 1e6,
+                p99_us=percentile(ordered, 0.99) * 1e6)
+
+
+def run_memory(schema, records):
+    """
+    returns the peak memory used while validating records, in bytes,
+    and how it was measured.  ru_maxrss is the peak over the life of a
+    process, so the records are validated in a child process, and its
+    peak is taken relative to its size before validating.
+    """
+    if resource is None or not hasattr(os, 'fork'):
+        return None, None
+    r, w=os.pipe()
+    pid=os.fork()
+    if pid==0:
+        try:
+            os.close(r)
+            gc.collect()
+            before=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            for data in records:
+                validate(schema, data)
+            peak=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            os.write(w, str(peak - before))
+        finally:
+            os._exit(0)
+    os.close(w)
+    try:
+        out=[]
+        while True:
+            chunk=os.read(r, 64)
+            if not chunk:
+                break
+            out.append(chunk)
+    finally:
+        os.close(r)
+        os.waitpid(pid, 0)
+    if not out:
+        return None, None
+    peak=int(''.join(out))
+    if sys.platform!='darwin':
+        # kilobytes everywhere but OS X
+        peak*=1024
+    return peak, 'maxrss'
+
+
+workloads={'example' : example_workload,
+           'synthetic' : synthetic_workload}
+
+
+def main(args=None):
+    parser=OptionParser(usage="%prog [options]")
+    parser.add_option('-w', '--workload', action='append', default=[],
+                      choices=sorted(workloads),
+                      help="workload to run: %s (may be repeated; "
+                           "default all)" % ', '.join(sorted(workloads)))
+    parser.add_option('-n', '--records', type='int', default=1000000,
+                      help="records to validate per workload [%default]")
+    parser.add_option('-i', '--invalid-rate', type='float', default=0.3,
+                      help="fraction of records that are invalid [%default]")
+    parser.add_option('-d', '--distinct', type='int', default=10000,
+                      help="distinct records generated [%default]")
+    parser.add_option('-m', '--memory-records', type='int', default=100000,
+                      help="records validated in the memory pass [%default]")
+    parser.add_option('-s', '--seed', type='int', default=1,
+                      help="random seed [%default]")
+    parser.add_option('-o', '--output', metavar='FILE',
+                      help="write the results to FILE as JSON")
+    options, args=parser.parse_args(args)
+    results={}
+    print "%-10s %10s %8s %12s %10s %10s %14s" % ('workload', 'records',
+                                                  'invalid', 'records/s',
+                                                  'p50 us', 'p99 us',
+                                                  'peak memory')
+    for name in options.workload or sorted(workloads):
+        schema, make=workloads[name]()
+        pool=corpus(make,
+                    max(min(options.distinct, options.records), 1),
+                    options.invalid_rate,
+                    options.seed)
+        res=run_timing(schema, cycle(pool, options.records))
+        memory_records=min(options.memory_records, options.records)
+        peak, method=run_memory(schema, cycle(pool, memory_records))
+        res.update(peak_bytes=peak,
+                   memory_method=method,
+                   memory_records=memory_records)
+        results[name]=res
+        if peak is None:
+            memory='n/a'
+        else:
+            memory='%.1f MB %s' % (peak / 1048576.0, method)
+        print "%-10s %10d %8d %12.0f %10.1f %10.1f %14s" % (
+            name, res['records'], res['invalid'], res['records_per_sec'],
+            res['p50_us'], res['p99_us'], memory)
+    if options.output:
+        doc=dict(meta=dict(validino=V.__version__,
+                           python=platform.python_version(),
+                           implementation=platform.python_implementation(),
+                           platform=platform.platform(),
+                           time=time.strftime('%Y-%m-%dT%H:%M:%S'),
+                           invalid_rate=options.invalid_rate,
+                           seed=options.seed),
+                 results=results)
+        f=open(options.output, 'w')
+        try:
+            json.dump(doc, f, indent=1, sort_keys=True)
+        finally:
+            f.close()
+    return 0
+
+
+if __name__=='__main__':
+    sys.exit(main())
@@ -56,7 +56,7 @@ validators=dict(
            either(empty(),
                   convert_telephone)),
     email=(not_empty("Please enter an email address"),
-           email("Please enter a valid email address")),
+           email(msg="Please enter a valid email address")),
     email_confirm=lambda x: x,
     comment=(strip,
              default(''),
@@ -71,14 +71,15 @@ schema=Schema(validators,
               allow_extra=True,
               allow_missing=True)
 
-data=getDataFromSomewhere()
+if __name__=='__main__':
+    data=getDataFromSomewhere()
 
-try:
-    converted=schema(data)
-except Invalid, e:
-    errors=e.unpack_errors()
-    doSomethingWithErrors(errors, data)
-else:
-    goToTown(converted)
+    try:
+        converted=schema(data)
+    except Invalid, e:
+        errors=e.unpack_errors()
+        doSomethingWithErrors(errors, data)
+    else:
+        goToTown(converted)
 
     
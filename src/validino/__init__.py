@@ -39,5 +39,7 @@ from validino.base import *
 from validino.extra import *
 from validino.messages import *
 from validino.field import *
+from validino.nested import *
+from validino.threaded import *
 
 __version__='0.2.2'
@@ -1,13 +1,29 @@
-import datetime
+import logging
 import re
-import time
+import sys
+from collections import deque
+from threading import Lock
+from timeit import default_timer
 
-from .messages import getMessages
+try:
+    import multiprocessing
+except ImportError:
+    multiprocessing=None
+
+from .messages import getGeneration, getMessages
+from .timeformat import compile_format
+from .util import LRUCache
 
 __all__=['Invalid',
+         'Failure',
+         'FrozenDict',
+         'add_observer',
+         'as_result',
+         'calls_result',
          'check',
          'clamp',
          'clamp_length',
+         'compile_pattern',
          'compose',
          'confirm_type',
          'default',
@@ -21,6 +37,7 @@ __all__=['Invalid',
          'fields_match',
          'is_list',
          'is_scalar',
+         'iter_unnest',
          'not_equal',
          'integer',
          'not_empty',
@@ -29,14 +46,45 @@ __all__=['Invalid',
          'parse_date',
          'parse_datetime',
          'parse_time',
+         'pattern_cache_info',
          'regex',
          'regex_sub',
+         'remove_observer',
          'Schema',
          'strip',
          'to_list',
          'to_scalar',
          'to_unicode',
-         'translate']
+         'translate',
+         'Validator',
+         'Belongs',
+         'Check',
+         'Clamp',
+         'ClampLength',
+         'Compose',
+         'ConfirmType',
+         'Default',
+         'Either',
+         'Empty',
+         'Equal',
+         'Excursion',
+         'FieldsEqual',
+         'FieldsMatch',
+         'Integer',
+         'IsList',
+         'IsScalar',
+         'NotBelongs',
+         'NotEmpty',
+         'NotEqual',
+         'ParseDate',
+         'ParseDatetime',
+         'ParseTime',
+         'Regex',
+         'RegexSub',
+         'ToList',
+         'ToScalar',
+         'ToUnicode',
+         'Translate']
 
 
 def _add_error_message(d, k, msg):
@@ -60,21 +108,89 @@ def _msg(msg, key, default):
     return msg.get(key, default)
 
          
+class _MessageCache(object):
+    """
+    mixin for objects with a msg attribute that caches the message
+    text resolved for each key, so that repeated failures do not go
+    back to the message catalog.  Text taken from the global catalog
+    is resolved again once the catalog has been swapped with
+    setMessages() or msg().
+    """
+    __slots__=()
+
+    def _message(self, key, default):
+        if self.msg is None:
+            generation=getGeneration()
+        else:
+            generation=None
+        try:
+            cached_generation, cache=self._msgcache
+        except AttributeError:
+            cached_generation=cache=None
+        if cache is None or cached_generation!=generation:
+            cache={}
+            self._msgcache=(generation, cache)
+        try:
+            return cache[key]
+        except KeyError:
+            text=cache[key]=_msg(self.msg, key, default)
+            return text
+
+    def _failure(self, key, default):
+        """
+        returns a Failure with the message for key, remembering the
+        key.
+        """
+        return Failure(self._message(key, default), key=key)
+
+         
 def dict_nest(data, separator='.'):
     """
     takes a flat dictionary with string keys and turns it into a
     nested one by splitting keys on the given separator.
     """
     res={}
-    for k in data:
-        levels=k.split(separator)
-        d=res
-        for k1 in levels[:-1]:
-            d.setdefault(k1, {})
-            d=d[k1]
-        d[levels[-1]]=data[k]
+    # the dictionary for each parent path seen so far, so that
+    # sibling keys don't each walk down from the top.
+    parents={}
+    for k, v in data.iteritems():
+        path, sep, leaf=k.rpartition(separator)
+        if not sep:
+            d=res
+        else:
+            d=parents.get(path)
+            if d is None:
+                d=res
+                for k1 in path.split(separator):
+                    d=d.setdefault(k1, {})
+                parents[path]=d
+        if leaf in d and isinstance(d[leaf], dict):
+            # a subtree is being replaced, so the dictionaries within
+            # it are no longer in the result
+            prefix=k + separator
+            for p in [p for p in parents if p==k or p.startswith(prefix)]:
+                del parents[p]
+        d[leaf]=v
     return res
 
+def iter_unnest(data, separator='.'):
+    """
+    like dict_unnest(), but yields the (path, value) pairs of the flat
+    dictionary one at a time instead.
+    """
+    stack=[(None, data.iteritems())]
+    while stack:
+        prefix, items=stack[-1]
+        for k, v in items:
+            if prefix is not None:
+                k="%s%s%s" % (prefix, separator, k)
+            if isinstance(v, dict):
+                stack.append((k, v.iteritems()))
+                break
+            yield k, v
+        else:
+            stack.pop()
+
 def dict_unnest(data, separator='.'):
     """
     takes a dictionary with string keys and values which may be either
@@ -84,15 +200,7 @@ def dict_unnest(data, separator='.'):
 
     This is the inverse operation of dict_nest().
     """
-    res={}
-    for k, v in data.iteritems():
-        if isinstance(v, dict):
-            v=dict_unnest(v, separator)
-            for k1, v1 in v.iteritems():
-                res["%s%s%s" % (k, separator, k1)]=v1
-        else:
-            res[k]=v
-    return res
+    return dict(iter_unnest(data, separator))
         
 class Invalid(Exception):
     # this should support nested exceptions and
@@ -182,7 +290,241 @@ class Invalid(Exception):
         return result
 
 
-class Schema(object):
+class Failure(object):
+    """
+    the outcome of a failed validation in exception-free mode, where
+    validators return either the converted value or a Failure rather
+    than raising Invalid.
+
+    A Failure holds the arguments Invalid would have been given (or an
+    exception already raised by a plain validator function), and only
+    builds the exception when it is asked for one.  Failures from the
+    validators in this package also carry the key of their message in
+    the message catalog (such as 'integer' or 'email.domain'), for
+    instrumentation; otherwise the key is None.
+    """
+    __slots__=('args', 'key', '_exception')
+
+    def __init__(self, *args, **kw):
+        self.args=args
+        self.key=kw.pop('key', None)
+        if kw:
+            raise TypeError("unexpected keyword arguments: %s"
+                            % ', '.join(kw))
+        self._exception=None
+
+    @classmethod
+    def wrap(cls, exception):
+        f=cls()
+        f._exception=exception
+        return f
+
+    @property
+    def field(self):
+        return getattr(self._exception, 'field', None)
+
+    def exception(self):
+        """
+        returns the Invalid (or other) exception for this failure.
+        Any failures nested in error dictionaries are converted too.
+        """
+        if self._exception is None:
+            args=[]
+            for a in self.args:
+                if isinstance(a, dict):
+                    a=dict([(k, _unfail(v)) for k, v in a.iteritems()])
+                args.append(a)
+            self._exception=Invalid(*args)
+        return self._exception
+
+    def unpack_errors(self, force_dict=True):
+        return self.exception().unpack_errors(force_dict)
+
+    def __repr__(self):
+        return 'Failure(%r)' % (self.exception(),)
+
+
+def _unfail(v):
+    if isinstance(v, list):
+        return [_unfail(x) for x in v]
+    if v.__class__ is Failure:
+        return v.exception()
+    return v
+
+
+def calls_result(validator):
+    """
+    whether calling the validator just runs its result() method: its
+    class's __call__ is marked with a true result_call attribute, as
+    those of Validator, Schema and Field, which do nothing but turn a
+    Failure into an exception, are.  Classes that override __call__
+    with something else have their __call__ honoured.
+    """
+    return getattr(getattr(type(validator), '__call__', None),
+                   'result_call',
+                   False)
+
+
+def as_result(validator):
+    """
+    returns a function that applies the validator in exception-free
+    mode: it returns either the converted value or a Failure.
+    Validator instances, schemas and fields do this natively, unless
+    their class overrides __call__; other callables are wrapped, and
+    any Invalid they raise is caught.
+    """
+    if calls_result(validator):
+        return validator.result
+    def f(value):
+        try:
+            return validator(value)
+        except Invalid, e:
+            return Failure.wrap(e)
+    return f
+
+
+class Validator(_MessageCache):
+    """
+    base class for validators that keep their configuration in slots
+    rather than in a closure, so that they can be pickled (and hence
+    sent to other processes or cached on disk) and compared by value.
+
+    Subclasses list their constructor arguments, in order, in _fields;
+    these determine pickling, equality and hashing.
+
+    Subclasses implement result(), which returns either the converted
+    value or a Failure; calling the validator raises the Failure's
+    exception instead.
+    """
+    __slots__=('_msgcache',)
+    _fields=()
+
+    def __call__(self, value):
+        res=self.result(value)
+        if res.__class__ is Failure:
+            raise res.exception()
+        return res
+
+    __call__.result_call=True
+
+    def result(self, value):
+        try:
+            return self(value)
+        except Invalid, e:
+            return Failure.wrap(e)
+
+    def _values(self):
+        return tuple([getattr(self, k) for k in self._fields])
+
+    def __reduce__(self):
+        return (self.__class__, self._values())
+
+    def __eq__(self, other):
+        return (self.__class__ is other.__class__
+                and self._values()==other._values())
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        try:
+            return hash((self.__class__, self._values()))
+        except TypeError:
+            # unhashable configuration, such as a list domain
+            return hash(self.__class__)
+
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__,
+                           ', '.join(['%s=%r' % (k, getattr(self, k))
+                                      for k in self._fields]))
+
+
+def _readonly(self, *args, **kw):
+    raise TypeError("%s is read-only" % self.__class__.__name__)
+
+class FrozenDict(dict):
+    """
+    a dictionary that can't be changed once made.
+    """
+    __slots__=()
+
+    __setitem__=__delitem__=clear=pop=popitem=setdefault=update=_readonly
+
+    def __reduce__(self):
+        return (self.__class__, (dict(self),))
+
+    def __repr__(self):
+        return 'FrozenDict(%s)' % dict.__repr__(self)
+
+
+# observers notified of the steps of every schema; the tuple is
+# replaced, never mutated, so that schemas can read it without locking.
+_observers=()
+_observers_lock=Lock()
+_log=logging.getLogger('validino')
+
+def add_observer(observer):
+    """
+    registers an observer to be notified of each step of every
+    schema, as with Schema.add_observer().
+    """
+    global _observers
+    _observers_lock.acquire()
+    try:
+        _observers=_observers + (observer,)
+    finally:
+        _observers_lock.release()
+
+def remove_observer(observer):
+    """
+    unregisters an observer registered with add_observer().
+    """
+    global _observers
+    _observers_lock.acquire()
+    try:
+        observers=list(_observers)
+        observers.remove(observer)
+        _observers=tuple(observers)
+    finally:
+        _observers_lock.release()
+
+
+def _notify(observers, schema, key, elapsed, ok, message_key):
+    # an observer that raises mustn't change the outcome of the step
+    for observer in observers:
+        try:
+            observer(schema, key, elapsed, ok, message_key)
+        except Exception:
+            _log.exception("observer %r failed", observer)
+
+def _observe(schema, key, vfunc, observers):
+    """
+    wraps the validator of a schema step so that each call is timed
+    and reported to the observers.
+    """
+    timer=default_timer
+    def observed(value):
+        start=timer()
+        try:
+            res=vfunc(value)
+        except Exception:
+            elapsed=timer() - start
+            exc_info=sys.exc_info()
+            _notify(observers, schema, key, elapsed, False, None)
+            raise exc_info[0], exc_info[1], exc_info[2]
+        elapsed=timer() - start
+        if res.__class__ is Failure:
+            ok=False
+            message_key=res.key
+        else:
+            ok=True
+            message_key=None
+        _notify(observers, schema, key, elapsed, ok, message_key)
+        return res
+    return observed
+
+
+class Schema(_MessageCache):
     """
     creates a validator from a dictionary of subvalidators that will
     be used to validate a dictionary of data, returning a new
@@ -205,150 +547,467 @@ class Schema(object):
 
     The subvalidators are sorted by key before being executed.  Therefore,
     subvalidators with plural keys will always be executed after those
-    with singular keys.
+    with singular keys.  A step with a plural key depends on the
+    earlier steps for any of its keys, whose converted values it is
+    passed; graph() and levels() describe these dependencies.
+
+    If skip_failed is true, a step with a plural key is skipped when
+    any of its keys failed its own step, or belongs to a plural step
+    that was skipped, so that a cross-field check such as
+    fields_equal() doesn't add errors about fields that are already in
+    error.
+
+    The subvalidators are copied when the schema is created, and
+    the schema's subvalidators attribute is read-only: changing the
+    dictionary passed in afterwards has no effect on the schema, and
+    changing the attribute's dictionary in place raises TypeError.  To
+    change the subvalidators, assign a new dictionary to the attribute.
 
     If allow_missing is False, then any missing keys in the input will
     give rise to an error.  Similarly, if allow_extra is False, any
     extra keys will result in an error.
 
+    Observers registered with add_observer(), on the schema or
+    globally, are called after each step as observer(schema, key,
+    seconds, ok, message_key), with the wall time the step took,
+    whether it passed, and the message key of its Failure, if any.
+    An exception raised by an observer is logged to the 'validino'
+    logger and otherwise ignored, so that it can't change the result
+    of the step.  Without observers, schemas run uninstrumented.
+
     """    
+    _observers=()
+
     def __init__(self,
                  subvalidators,
                  msg=None,
                  allow_missing=True,
-                 allow_extra=True):
+                 allow_extra=True,
+                 skip_failed=False):
         self.subvalidators=subvalidators
         self.msg=msg
         self.allow_missing=allow_missing
         self.allow_extra=allow_extra
+        self.skip_failed=skip_failed
 
-    def _keys(self):
+    def _get_subvalidators(self):
+        return self._subvalidators
+
+    def _set_subvalidators(self, subvalidators):
+        # copied, so that the plan can't go stale behind our back
+        self._subvalidators=FrozenDict(subvalidators)
+        self._compile()
+
+    subvalidators=property(_get_subvalidators, _set_subvalidators)
+
+    def _compile(self):
+        """
+        builds the execution plan walked by result(): a tuple of
+        (key, validator, is_plural) steps, singular keys first, with
+        list/tuple subvalidators already composed and every validator
+        in exception-free form (see as_result()), plus the frozen set
+        of all keys the schema knows about.
+        """
+        singular=[]
+        plural=[]
         schemakeys=set()
-        for x in self.subvalidators:
-            if isinstance(x, (list, tuple)):
-                for x1 in x:
-                    schemakeys.add(x1)
+        for k in self._subvalidators:
+            if isinstance(k, (list, tuple)):
+                plural.append(k)
+                schemakeys.update(k)
             else:
-                schemakeys.add(x)
-        return schemakeys
+                singular.append(k)
+                schemakeys.add(k)
+        plan=[]
+        for k in sorted(singular) + sorted(plural):
+            vfunc=self._subvalidators[k]
+            if isinstance(vfunc, (list, tuple)):
+                vfunc=compose(*vfunc)
+            plan.append((k, as_result(vfunc), isinstance(k, (list, tuple))))
+        self._plan=tuple(plan)
+        self._schemakeys=frozenset(schemakeys)
+
+    def add_observer(self, observer):
+        """
+        registers an observer to be notified of each step of this
+        schema.
+        """
+        self._observers=self._observers + (observer,)
+
+    def remove_observer(self, observer):
+        observers=list(self._observers)
+        observers.remove(observer)
+        self._observers=tuple(observers)
+
+    def _steps(self):
+        """
+        returns the plan to execute: the compiled one, or, if there
+        are observers, a copy with each validator wrapped to report to
+        them, which is kept until the observers change.
+        """
+        if not (_observers or self._observers):
+            return self._plan
+        observers=self._observers + _observers
+        cached=self.__dict__.get('_observed')
+        if (cached is not None
+            and cached[0] is self._plan
+            and cached[1]==observers):
+            return cached[2]
+        plan=tuple([(step[0], _observe(self, step[0], step[1], observers))
+                    + step[2:] for step in self._plan])
+        self._observed=(self._plan, observers, plan)
+        return plan
+
+    def _dependencies(self):
+        cached=self.__dict__.get('_dag')
+        if cached is not None and cached[0] is self._plan:
+            return cached[1], cached[2]
+        graph={}
+        level={}
+        writers={}
+        for step in self._plan:
+            k=step[0]
+            if step[2]:
+                keys=k
+            else:
+                keys=(k,)
+            deps=set()
+            for x in keys:
+                deps.update(writers.get(x, ()))
+            graph[k]=frozenset(deps)
+            level[k]=max([level[d] + 1 for d in deps] or [0])
+            for x in keys:
+                writers.setdefault(x, []).append(k)
+        levels=[[] for i in range(max(level.values() or [-1]) + 1)]
+        for step in self._plan:
+            levels[level[step[0]]].append(step[0])
+        self._dag=(self._plan, graph, levels)
+        return graph, levels
+
+    def graph(self):
+        """
+        returns the dependency graph of the schema's steps, as a
+        dictionary mapping the key of each step to the frozen set of
+        keys of the steps it depends on.
+        """
+        return self._dependencies()[0].copy()
+
+    def levels(self):
+        """
+        returns the keys of the schema's steps grouped into levels, as
+        a list of lists in execution order: the steps of each level
+        depend only on steps of earlier levels, and so are independent
+        of each other.
+        """
+        return [keys[:] for keys in self._dependencies()[1]]
+
+    def __getstate__(self):
+        # the plan holds bound methods, which cannot be pickled; it
+        # is rebuilt on unpickling.  Observers are not pickled.
+        state=self.__dict__.copy()
+        del state['_plan'], state['_schemakeys']
+        for k in ('_msgcache', '_observed', '_observers', '_dag'):
+            state.pop(k, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._compile()
+
+    def _keys(self):
+        return self._schemakeys
 
 
     def __call__(self, data):
+        res=self.result(data)
+        if res.__class__ is Failure:
+            raise res.exception()
+        return res
+
+    __call__.result_call=True
+
+    def _check_keys(self, data):
+        """
+        returns a Failure if data has extra or missing keys that the
+        schema doesn't allow, else None.
+        """
+        if not self.allow_extra:
+            schemakeys=self._schemakeys
+            for k in data:
+                if k not in schemakeys:
+                    return self._failure('schema.extra',
+                                         'extra keys in input')
+        if not self.allow_missing:
+            for k in self._schemakeys:
+                if k not in data:
+                    return self._failure('schema.missing',
+                                         'missing keys in input')
+        return None
+
+    def result(self, data):
+        """
+        validates data in exception-free mode, returning either the
+        converted dictionary or a Failure.  Subvalidators that are
+        Validator instances (or schemas) report failures without
+        raising; Invalid is only constructed if the Failure is turned
+        into an exception.
+        """
         res={}
-        exceptions={}
+        failures={}
         if not (self.allow_extra and self.allow_missing):
-            inputkeys=set(data.keys())
-            schemakeys=self._keys()
-            if not self.allow_extra:
-                if inputkeys.difference(schemakeys):
-                    raise Invalid(_msg(self.msg,
-                                       'schema.extra',
-                                       'extra keys in input'))
-            if not self.allow_missing:
-                if schemakeys.difference(inputkeys):
-                    raise Invalid(_msg(self.msg,
-                                       'schema.missing',
-                                       'missing keys in input'))
-                
-        for k in sorted(self.subvalidators):
-            vfunc=self.subvalidators[k]
-            if isinstance(vfunc, (list, tuple)):
-                vfunc=compose(*vfunc)
-            have_plural=isinstance(k, (list,tuple))
+            failure=self._check_keys(data)
+            if failure is not None:
+                return failure
+
+        skip=self.skip_failed
+        failed=set()
+        for k, vfunc, have_plural in self._steps():
             if have_plural:
-                vdata=tuple(res.get(x, data.get(x)) for x in k)
+                if skip and failed and failed.intersection(k):
+                    failed.update(k)
+                    continue
+                vdata=tuple([res.get(x, data.get(x)) for x in k])
             else:
                 vdata=res.get(k, data.get(k))
             try:
                 tmp=vfunc(vdata)
             except Exception, e:
-                # if the exception specifies a field name,
+                tmp=Failure.wrap(e)
+            if tmp.__class__ is Failure:
+                # if the failure specifies a field name,
                 # let that override the key in the validator
                 # dictionary
-                name=getattr(e, 'field', k) or k
-                exceptions.setdefault(name, [])
-                exceptions[name].append(e)
+                name=tmp.field or k
+                failures.setdefault(name, [])
+                failures[name].append(tmp)
+                if skip and not have_plural:
+                    failed.add(k)
+            elif have_plural:
+                res.update(zip(k, tmp))
             else:
-                if have_plural:
-                    res.update(dict(zip(k, tmp)))
-                else:
-                    res[k]=tmp
+                res[k]=tmp
 
-        if exceptions:
-            raise Invalid(_msg(self.msg,
-                               "schema.error",
-                               "Problems were found in the submitted data."),
-                          exceptions)
-        return res        
-            
+        if failures:
+            m=self._message("schema.error",
+                            "Problems were found in the submitted data.")
+            return Failure(m, failures, key='schema.error')
+        return res
 
-def confirm_type(typespec, msg=None):
-    def f(value):
-        if isinstance(value, f.typespec):
+    def validate_many(self, records, chunksize=None):
+        """
+        lazily validates an iterable of data dictionaries, yielding
+        an (index, converted, errors) triple for each one, where index
+        is the record's position in the input.  For valid records,
+        errors is None; for invalid ones, converted is None and errors
+        is the result of the Invalid exception's unpack_errors().
+
+        If chunksize is given, lists of up to chunksize triples are
+        yielded instead, so that results may be written out in
+        batches.  Only one chunk is held in memory at a time.
+        """
+        if chunksize is None:
+            return self._iter_validate(records)
+        if chunksize < 1:
+            raise ValueError("chunksize must be positive: %r" % chunksize)
+        return self._iter_chunks(self._iter_validate(records), chunksize)
+
+    def _iter_validate(self, records):
+        result=self.result
+        for i, data in enumerate(records):
+            converted=result(data)
+            if converted.__class__ is Failure:
+                yield i, None, converted.unpack_errors()
+            else:
+                yield i, converted, None
+
+    def validate_parallel(self, records, workers=None, chunksize=1000):
+        """
+        like validate_many(), but farms chunks of chunksize records out
+        to a pool of worker processes (by default, one per cpu) and
+        yields the (index, converted, errors) triples back in input
+        order.  Only a couple of chunks per worker are in flight at any
+        time, so long inputs are not read into memory up front.
+
+        The schema is handed to each worker when the pool starts; on
+        platforms that fork, it does not need to be picklable.  The
+        records and the converted values must be.
+        """
+        if multiprocessing is None:
+            raise RuntimeError("multiprocessing not available, "
+                               "cannot validate in parallel")
+        if chunksize < 1:
+            raise ValueError("chunksize must be positive: %r" % chunksize)
+        if workers is None:
+            workers=multiprocessing.cpu_count()
+        return self._iter_parallel(records, workers, chunksize)
+
+    def _iter_parallel(self, records, workers, chunksize):
+        # the pool is only started once iteration begins, and is shut
+        # down however iteration ends, including when the generator
+        # is abandoned and closed.
+        pool=multiprocessing.Pool(workers, _init_worker, (self,))
+        window=2 * workers
+        pending=deque()
+        finished=False
+        try:
+            chunks=self._iter_chunks(enumerate(records), chunksize)
+            for chunk in chunks:
+                pending.append(pool.apply_async(_validate_chunk, (chunk,)))
+                if len(pending)>=window:
+                    for r in pending.popleft().get():
+                        yield r
+            while pending:
+                for r in pending.popleft().get():
+                    yield r
+            finished=True
+        finally:
+            if finished:
+                pool.close()
+            else:
+                pool.terminate()
+            pool.join()
+
+    @staticmethod
+    def _iter_chunks(results, chunksize):
+        chunk=[]
+        for r in results:
+            chunk.append(r)
+            if len(chunk)>=chunksize:
+                yield chunk
+                chunk=[]
+        if chunk:
+            yield chunk
+
+
+# the schema used by validate_parallel() worker processes
+_worker_schema=None
+
+def _init_worker(schema):
+    global _worker_schema
+    _worker_schema=schema
+
+def _validate_chunk(chunk):
+    res=[]
+    for i, data in chunk:
+        converted=_worker_schema.result(data)
+        if converted.__class__ is Failure:
+            res.append((i, None, converted.unpack_errors()))
+        else:
+            res.append((i, converted, None))
+    return res
+
+
+class ConfirmType(Validator):
+    __slots__=_fields=('typespec', 'msg')
+
+    def __init__(self, typespec, msg=None):
+        self.typespec=typespec
+        self.msg=msg
+
+    def result(self, value):
+        if isinstance(value, self.typespec):
             return value
-        raise Invalid(_msg(f.msg,
-                           "confirm_type",
-                           "unexpected type"))
-    f.typespec=typespec
-    f.msg=msg
-    return f
+        return self._failure("confirm_type",
+                             "unexpected type")
 
-def translate(mapping, msg=None):
-    def f(value):
+def confirm_type(typespec, msg=None):
+    return ConfirmType(typespec, msg)
+
+
+class Translate(Validator):
+    __slots__=_fields=('mapping', 'msg')
+
+    def __init__(self, mapping, msg=None):
+        self.mapping=mapping
+        self.msg=msg
+
+    def result(self, value):
         try:
-            return f.mapping[value]
+            return self.mapping[value]
         except KeyError:
-            raise Invalid(_msg(f.msg,
-                               "belongs",
-                               "invalid choice"))
-    f.mapping=mapping
-    f.msg=msg
-    return f
+            return self._failure("belongs",
+                                 "invalid choice")
 
-def to_unicode(encoding='utf8', errors='strict', msg=None):
-    def f(value):
+def translate(mapping, msg=None):
+    return Translate(mapping, msg)
+
+
+class ToUnicode(Validator):
+    __slots__=_fields=('encoding', 'errors', 'msg')
+
+    def __init__(self, encoding='utf8', errors='strict', msg=None):
+        self.encoding=encoding
+        self.errors=errors
+        self.msg=msg
+
+    def result(self, value):
         if isinstance(value, unicode):
             return value
         else:
             try:
-                return value.decode(f.encoding, f.errors)
+                return value.decode(self.encoding, self.errors)
             except UnicodeError, e:
-                raise Invalid(_msg(f.msg,
-                                   'to_unicode',
-                                   'decoding error'))
-    f.encoding=encoding
-    f.errors=errors
-    f.msg=msg
-    return f
+                return self._failure('to_unicode',
+                                     'decoding error')
 
+def to_unicode(encoding='utf8', errors='strict', msg=None):
+    return ToUnicode(encoding, errors, msg)
+
+
+class IsScalar(Validator):
+    __slots__=_fields=('msg', 'listtypes')
+
+    def __init__(self, msg=None, listtypes=(list,)):
+        self.msg=msg
+        self.listtypes=listtypes
+
+    def result(self, value):
+        if isinstance(value, self.listtypes):
+            return self._failure('is_scalar',
+                                 'expected scalar value')
+        return value
 
 def is_scalar(msg=None, listtypes=(list,)):
     """
     Raises an exception if the value is not a scalar.
     """
-    def f(value):
-        if isinstance(value, f.listtypes):
-            raise Invalid(_msg(f.msg,
-                               'is_scalar',
-                               'expected scalar value'))
+    return IsScalar(msg, listtypes)
+
+
+class IsList(Validator):
+    __slots__=_fields=('msg', 'listtypes')
+
+    def __init__(self, msg=None, listtypes=(list,)):
+        self.msg=msg
+        self.listtypes=listtypes
+
+    def result(self, value):
+        if not isinstance(value, self.listtypes):
+            return self._failure("is_list",
+                                 "expected list value")
         return value
-    f.listtypes=listtypes
-    f.msg=msg
-    return f
 
 def is_list(msg=None, listtypes=(list,)):
     """
     Raises an exception if the value is not a list.
     """
-    def f(value):
-        if not isinstance(value, f.listtypes):
-            raise Invalid(_msg(f.msg,
-                               "is_list",
-                               "expected list value"))
+    return IsList(msg, listtypes)
+
+
+class ToScalar(Validator):
+    __slots__=_fields=('listtypes',)
+
+    def __init__(self, listtypes=(list,)):
+        self.listtypes=listtypes
+
+    def result(self, value):
+        if isinstance(value, self.listtypes):
+            return value[0]
         return value
-    f.listtypes=listtypes
-    f.msg=msg    
-    return f
+
+    # never fails, so there is nothing to raise
+    __call__=result
+
 
 def to_scalar(listtypes=(list,)):
     """
@@ -357,12 +1016,23 @@ def to_scalar(listtypes=(list,)):
 
     This raises no exceptions.
     """
-    def f(value):
-        if isinstance(value, f.listtypes):
-            return value[0]
+    return ToScalar(listtypes)
+
+
+class ToList(Validator):
+    __slots__=_fields=('listtypes',)
+
+    def __init__(self, listtypes=(list,)):
+        self.listtypes=listtypes
+
+    def result(self, value):
+        if not isinstance(value, self.listtypes):
+            return [value]
         return value
-    f.listtypes=listtypes
-    return f
+
+    # never fails, so there is nothing to raise
+    __call__=result
+
 
 def to_list(listtypes=(list,)):
     """
@@ -371,12 +1041,23 @@ def to_list(listtypes=(list,)):
 
     This raises no exceptions.
     """
-    def f(value):
-        if not isinstance(value, f.listtypes):
-            return [value]
+    return ToList(listtypes)
+
+
+class Default(Validator):
+    __slots__=_fields=('defaultValue',)
+
+    def __init__(self, defaultValue):
+        self.defaultValue=defaultValue
+
+    def result(self, value):
+        if value is None:
+            return self.defaultValue
         return value
-    f.listtypes=listtypes
-    return f
+
+    # never fails, so there is nothing to raise
+    __call__=result
+
 
 def default(defaultValue):
     """
@@ -384,41 +1065,77 @@ def default(defaultValue):
 
     This raises no exceptions.
     """
-    def f(value):
-        if value is None:
-            return f.defaultValue
-        return value
-    f.defaultValue=defaultValue
-    return f
-        
+    return Default(defaultValue)
+
+
+class _Combinator(Validator):
+    """
+    base class for validators built out of a series of other
+    validators passed as positional arguments.
+    """
+    __slots__=('validators', '_results')
+    _fields=('validators',)
+
+    def __init__(self, *validators):
+        self.validators=validators
+        self._results=tuple([as_result(v) for v in validators])
+
+    def __reduce__(self):
+        return (self.__class__, self.validators)
+
+
+class Either(_Combinator):
+    __slots__=()
+
+    def result(self, value):
+        res=None
+        for r in self._results:
+            try:
+                res=r(value)
+            except Exception, e:
+                res=Failure.wrap(e)
+            if res.__class__ is not Failure:
+                return res
+        if res is None:
+            raise ValueError("either() requires at least one validator")
+        return res
+
 def either(*validators):
     """
     Tries each of a series of validators in turn, swallowing any
     exceptions they raise, and returns the result of the first one
     that works.  If none work, the last exception caught is re-raised.
     """
-    last_exception=None
-    def f(value):
-        for v in validators:
-            try:
-                value=v(value)
-            except Exception, e:
-                last_exception=e
-            else:
-                return value
-        raise last_exception
-    return f
+    return Either(*validators)
+
+
+class Compose(_Combinator):
+    __slots__=()
+
+    def result(self, value):
+        for r in self._results:
+            value=r(value)
+            if value.__class__ is Failure:
+                break
+        return value
 
 def compose(*validators):
     """
     Applies each of a series of validators in turn, passing the return
     value of each to the next.  
     """
-    def f(value):
-        for v in validators:
-            value=v(value)
+    return Compose(*validators)
+
+
+class Check(_Combinator):
+    __slots__=()
+
+    def result(self, value):
+        for r in self._results:
+            res=r(value)
+            if res.__class__ is Failure:
+                return res
         return value
-    return f
 
 def check(*validators):
     """
@@ -428,11 +1145,19 @@ def check(*validators):
     original input data (which, if it mutable, may have been changed).
     
     """
-    def f(value):
-        for v in validators:
-            v(value)
+    return Check(*validators)
+
+
+class Excursion(_Combinator):
+    __slots__=()
+
+    def result(self, value):
+        v1=value
+        for r in self._results:
+            v1=r(v1)
+            if v1.__class__ is Failure:
+                return v1
         return value
-    return f
 
 def excursion(*validators):
     """
@@ -441,48 +1166,72 @@ def excursion(*validators):
     data survives validation, you carry on from the point the
     excursion started.
     """
-    def f(value):
-        compose(*validators)(value)
-        return value
-    return f
+    return Excursion(*validators)
+
+
+class Equal(Validator):
+    __slots__=_fields=('val', 'msg')
+
+    def __init__(self, val, msg=None):
+        self.val=val
+        self.msg=msg
+
+    def result(self, value):
+        if value==self.val:
+            return value
+        return self._failure('eq', 'invalid value')
 
 def equal(val, msg=None):
-    def f(value):
-        if value==f.val:
+    return Equal(val, msg)
+
+
+class NotEqual(Validator):
+    __slots__=_fields=('val', 'msg')
+
+    def __init__(self, val, msg=None):
+        self.val=val
+        self.msg=msg
+
+    def result(self, value):
+        if value!=self.val:
             return value
-        raise Invalid(_msg(f.msg, 'eq', 'invalid value'))
-    f.val=val
-    f.msg=msg
-    return f
+        return self._failure('eq', 'invalid value')
 
 def not_equal(val, msg=None):
-    def f(value):
-        if value!=f.val:
-            return value
-        raise Invalid(_msg(f.msg, 'eq', 'invalid value'))
-    f.val=val
-    f.msg=msg
-    return f
+    return NotEqual(val, msg)
 
-def empty(msg=None):
-    def f(value):
+
+class Empty(Validator):
+    __slots__=_fields=('msg',)
+
+    def __init__(self, msg=None):
+        self.msg=msg
+
+    def result(self, value):
         if value == '' or value is None:
             return value
-        raise Invalid(_msg(f.msg,
-                           "empty",
-                           "No value was expected"))
-    f.msg=msg
-    return f
+        return self._failure("empty",
+                             "No value was expected")
 
-def not_empty(msg=None):
-    def f(value):
+def empty(msg=None):
+    return Empty(msg)
+
+
+class NotEmpty(Validator):
+    __slots__=_fields=('msg',)
+
+    def __init__(self, msg=None):
+        self.msg=msg
+
+    def result(self, value):
         if value!='' and value != None:
             return value
-        raise Invalid(_msg(f.msg,
-                           'notempty',
-                           "A non-empty value was expected"))
-    f.msg=msg
-    return f
+        return self._failure('notempty',
+                             "A non-empty value was expected")
+
+def not_empty(msg=None):
+    return NotEmpty(msg)
+
 
 def strip(value):
     """
@@ -495,78 +1244,119 @@ def strip(value):
     except AttributeError:
         return value
 
+
+class Clamp(Validator):
+    __slots__=_fields=('min', 'max', 'msg')
+
+    def __init__(self, min=None, max=None, msg=None):
+        self.min=min
+        self.max=max
+        self.msg=msg
+
+    def result(self, value):
+        if self.min is not None and value < self.min:
+            return self._failure("min",
+                                 "value below minimum")
+        if self.max is not None and value > self.max:
+            return self._failure("max",
+                                 "value above maximum")
+        return value
+
 def clamp(min=None, max=None, msg=None):
     """
     clamp a value between minimum and maximum values (either
     of which are optional).
     """
-    def f(value):
-        if f.min is not None and value < f.min:
-            raise Invalid(_msg(f.msg,
-                               "min",
-                               "value below minimum"))
-        if f.max is not None and value > f.max:
-            raise Invalid(_msg(f.msg,
-                               "max",
-                               "value above maximum"))
+    return Clamp(min, max, msg)
+
+
+class ClampLength(Validator):
+    __slots__=_fields=('min', 'max', 'msg')
+
+    def __init__(self, min=None, max=None, msg=None):
+        self.min=min
+        self.max=max
+        self.msg=msg
+
+    def result(self, value):
+        vlen=len(value)
+        if self.min is not None and vlen<self.min:
+            return self._failure("minlen",
+                                 "too short")
+        if self.max is not None and vlen >self.max:
+            return self._failure("maxlen",
+                                 "too long")
         return value
-    f.min=min
-    f.max=max
-    f.msg=msg
-    return f
 
 def clamp_length(min=None, max=None, msg=None):
     """
     clamp a value between minimum and maximum lengths (either
     of which are optional).
     """
-    def f(value):
-        vlen=len(value)
-        if f.min is not None and vlen<f.min:
-                raise Invalid(_msg(f.msg,
-                                   "minlen",
-                                   "too short"))
-        if f.max is not None and vlen >f.max:
-                raise Invalid(_msg(f.msg,
-                                   "maxlen",
-                                   "too long"))
-        return value
-    f.min=min
-    f.max=max
-    f.msg=msg
-    return f
+    return ClampLength(min, max, msg)
+
+
+class Belongs(Validator):
+    __slots__=_fields=('domain', 'msg')
+
+    def __init__(self, domain, msg=None):
+        self.domain=domain
+        self.msg=msg
+
+    def result(self, value):
+        if value in self.domain:
+            return value
+        return self._failure("belongs",
+                             "invalid choice")
 
 def belongs(domain, msg=None):
     """
     ensures that the value belongs to the domain
     specified.
     """
-    def f(value):
-        if value in f.domain:
+    return Belongs(domain, msg)
+
+
+class NotBelongs(Validator):
+    __slots__=_fields=('domain', 'msg')
+
+    def __init__(self, domain, msg=None):
+        self.domain=domain
+        self.msg=msg
+
+    def result(self, value):
+        if value not in self.domain:
             return value
-        raise Invalid(_msg(f.msg,
-                           "belongs",
-                           "invalid choice"))
-    f.domain=domain
-    f.msg=msg
-    return f
+        return self._failure("not_belongs",
+                             "invalid choice")
 
 def not_belongs(domain, msg=None):
     """
     ensures that the value does not belong to the domain
     specified.
     """
-    def f(value):
-        if value not in f.domain:
-            return value
-        raise Invalid(_msg(f.msg,
-                           "not_belongs",
-                           "invalid choice"))
-    f.domain=domain
-    f.msg=msg
-    return f
+    return NotBelongs(domain, msg)
+
+
 
+class ParseTime(Validator):
+    __slots__=('format', 'msg', '_parser')
+    _fields=('format', 'msg')
 
+    def __init__(self, format, msg=None):
+        self.format=format
+        self.msg=msg
+        self._parser=compile_format(format)
+
+    def _parse(self, value):
+        return self._parser.parse(value)
+
+    def result(self, value):
+        try:
+            return self._parse(value)
+        except ValueError:
+            return self._failure('parse_time',
+                                 "invalid time")
 
 def parse_time(format, msg=None):
     """
@@ -574,119 +1364,176 @@ def parse_time(format, msg=None):
     the given format, returning a timetuple,
     or raises an Invalid exception.
     """
-    def f(value):
-        try:
-            return time.strptime(value, f.format)
-        except ValueError:
-            raise Invalid(_msg(f.msg,
-                               'parse_time',
-                               "invalid time"))
-    f.format=format
-    f.msg=msg
-    return f
+    return ParseTime(format, msg)
+
+
+class ParseDate(ParseTime):
+    __slots__=()
+
+    def _parse(self, value):
+        return self._parser.date(value)
 
 def parse_date(format, msg=None):
     """
     like parse_time, but returns a datetime.date object.
     """
-    
-    def f(value):
-        v=parse_time(f.format, f.msg)(value)
-        return datetime.date(*v[:3])
-    f.format=format
-    f.msg=msg
-    return f
+    return ParseDate(format, msg)
+
+
+class ParseDatetime(ParseTime):
+    __slots__=()
+
+    def _parse(self, value):
+        return self._parser.datetime(value)
 
 def parse_datetime(format, msg=None):
     """
     like parse_time, but returns a datetime.datetime object.
     """
-    
-    def f(value):
-        v=parse_time(f.format, f.msg)(value)
-        return datetime.datetime(*v[:6])
-    f.format=format
-    f.msg=msg
-    return f                
+    return ParseDatetime(format, msg)
+
+
+class Integer(Validator):
+    __slots__=_fields=('msg',)
+
+    def __init__(self, msg=None):
+        self.msg=msg
+
+    def result(self, value):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return self._failure("integer",
+                                 "not an integer")
 
 def integer(msg=None):
     """
     attempts to coerce the value into an integer.
     """
-    def f(value):
-        try:
-            return int(value)
-        except (TypeError, ValueError):
-            raise Invalid(_msg(f.msg,
-                               "integer",
-                               "not an integer"))
-    f.msg=msg
-    return f
+    return Integer(msg)
+
+
+# compiled patterns shared by all regex validators in the process;
+# unlike the re module's own cache, this is not flushed wholesale
+# when it fills up.
+_pattern_cache=LRUCache(512)
 
+def _compile_pattern_key(key):
+    return re.compile(*key)
+
+def compile_pattern(pat, flags=0):
+    """
+    returns the compiled form of the regex pattern pat, from a
+    process-wide cache of bounded size.  Already compiled patterns
+    are returned as they are.
+    """
+    if not isinstance(pat, basestring):
+        return pat
+    return _pattern_cache.lookup((pat, flags), _compile_pattern_key)
+
+def pattern_cache_info():
+    """
+    returns a dictionary of statistics (hits, misses, size and
+    maxsize) for the compiled pattern cache.
+    """
+    return _pattern_cache.info()
+
+
+class Regex(Validator):
+    __slots__=('pat', 'msg', '_compiled')
+    _fields=('pat', 'msg')
+
+    def __init__(self, pat, msg=None):
+        self.pat=pat
+        self.msg=msg
+        self._compiled=compile_pattern(pat)
+
+    def result(self, value):
+        m=self._compiled.match(value)
+        if not m:
+            return self._failure('regex',
+                                 "does not match pattern")
+        return value
 
 def regex(pat, msg=None):
     """
     tests the value against the given regex pattern
-    and raises Invalid if it doesn't match.
+    and raises Invalid if it doesn't match.  The pattern
+    may be a string or a compiled pattern object.
     
     """
-    def f(value):
-        m=re.match(f.pat, value)
-        if not m:
-            raise Invalid(_msg(f.msg,
-                               'regex',
-                               "does not match pattern"))
-        return value
-    f.pat=pat
-    f.msg=msg
-    return f
+    return Regex(pat, msg)
+
+
+class RegexSub(Validator):
+    __slots__=('pat', 'sub', '_compiled')
+    _fields=('pat', 'sub')
+
+    def __init__(self, pat, sub):
+        self.pat=pat
+        self.sub=sub
+        self._compiled=compile_pattern(pat)
+
+    def result(self, value):
+        return self._compiled.sub(self.sub, value)
+
+    __call__=result
 
 def regex_sub(pat, sub):
     """
-    performs regex substitution on the input value.
+    performs regex substitution on the input value.  The pattern
+    may be a string or a compiled pattern object.
     """
-    def f(value):
-        return re.sub(f.pat, f.sub, value)
-    f.pat=pat
-    f.sub=sub
-    return f
+    return RegexSub(pat, sub)
+
+
+class FieldsEqual(Validator):
+    __slots__=_fields=('msg', 'field')
+
+    def __init__(self, msg=None, field=None):
+        self.msg=msg
+        self.field=field
+
+    def result(self, values):
+        if len(set(values))!=1:
+            m=self._message('fields_equal',
+                            "fields not equal")
+            if self.field is None:
+                return Failure(m, key='fields_equal')
+            else:
+                return Failure({self.field: m}, key='fields_equal')
+        return values
 
 def fields_equal(msg=None, field=None):
     """
     when passed a collection of values,
     verifies that they are all equal.
     """
-    def f(values):
-        if len(set(values))!=1:
-            m=_msg(f.msg,
-                   'fields_equal',
-                   "fields not equal")
-            if f.field is None:
-                raise Invalid(m)
+    return FieldsEqual(msg, field)
+
+
+class FieldsMatch(Validator):
+    __slots__=_fields=('name1', 'name2', 'msg', 'field')
+
+    def __init__(self, name1, name2, msg=None, field=None):
+        self.name1=name1
+        self.name2=name2
+        self.msg=msg
+        self.field=field
+
+    def result(self, value):
+        if value[self.name1]!=value[self.name2]:
+            m=self._message('fields_match',
+                            'fields do not match')
+            if self.field is not None:
+                return Failure({self.field: m}, key='fields_match')
             else:
-                raise Invalid({f.field: m})
-        return values
-    f.msg=msg
-    f.field=field
-    return f
+                return Failure(m, key='fields_match')
+        return value
 
 def fields_match(name1, name2, msg=None, field=None):
     """
     verifies that the values associated with the keys 'name1' and
     'name2' in value (which must be a dict) are identical.
     """
-    def f(value):
-        if value[f.name1]!=value[f.name2]:
-            m=_msg(f.msg,
-                   'fields_match',
-                   'fields do not match')
-            if f.field is not None:
-                raise Invalid({f.field: m})
-            else:
-                raise Invalid(m)
-        return value
-    f.name1=name1
-    f.name2=name2
-    f.msg=msg
-    f.field=field
-    return f
+    return FieldsMatch(name1, name2, msg, field)
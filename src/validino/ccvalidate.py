@@ -10,6 +10,11 @@ Carte Blanche, Discover, En Route, and JCB.
 import re
 import operator
 
+try:
+    import numpy
+except ImportError:
+    numpy=None
+
 _numonlyRE=re.compile(r'[- ]')
 
 ##########################################################################
@@ -94,9 +99,15 @@ prefixes.sort()
 prefixes.reverse()
 prefixes=[x[1] for x in prefixes]
 
+# for finding the longest matching prefix with a few dict lookups
+# rather than a scan of the whole list
+_prefix_set=frozenset(prefixes)
+_prefix_lengths=sorted(set([len(p) for p in prefixes]), reverse=True)
+
 def prefix_for_ccnum(ccnum):
-    for p in prefixes:
-        if ccnum.startswith(p):
+    for n in _prefix_lengths:
+        p=ccnum[:n]
+        if p in _prefix_set:
             return p
 
 def type_for_prefix(prefix):
@@ -106,6 +117,39 @@ def length_for_prefix(prefix):
     return prefix_length_map.get(prefix)
 
 
+_digitsRE=re.compile(r'[0-9]+\Z')
+
+# the Luhn contribution of each digit, in the odd (rightmost, not
+# doubled) and even (doubled) positions counting from the right.
+_luhn_odd=dict([(str(d), d) for d in range(10)])
+_luhn_even=dict([(str(d), sum(divmod(2 * d, 10))) for d in range(10)])
+
+def luhn_checksum(digits):
+    """
+    returns the Luhn sum, modulo 10, of a string of ASCII digits;
+    for a number with a correct check digit, this is 0.
+    """
+    return (sum(map(_luhn_odd.__getitem__, digits[::-2]))
+            + sum(map(_luhn_even.__getitem__, digits[-2::-2]))) % 10
+
+def luhn_check_digit(digits):
+    """
+    returns the check digit (as a string) that, appended to a string
+    of ASCII digits, makes a number that satisfies Luhn's formula.
+    """
+    return str(-luhn_checksum(digits + '0') % 10)
+
+def _legacy_luhn_checksum(cc):
+    # for numbers long() accepted that aren't plain ASCII digits;
+    # this raises ValueError on non-digits, as it always has.
+    cc=map(int, list(cc))
+    cc.reverse()
+    s=0
+    for i in range(len(cc)):
+       s+=reduce(operator.add, divmod((1+(i%2))*cc[i], 10))
+    return s % 10
+
+
 class CreditCardValidationException(Exception):
     pass
 
@@ -128,11 +172,13 @@ def check_credit_card(ccnum, cctype=None):
     a supported credit card type, a ValueError will be raised.
     """
     cc=_numonlyRE.sub('', ccnum)
-    try:
-        long(cc)
-    except ValueError:
-        raise CreditCardValidationException, \
-              "bad characters in card number: %s" % cc
+    digits_only=_digitsRE.match(cc) is not None
+    if not digits_only:
+        try:
+            long(cc)
+        except ValueError:
+            raise CreditCardValidationException, \
+                  "bad characters in card number: %s" % cc
     prefix=prefix_for_ccnum(cc)
     if not prefix:
         raise UnknownCreditCardPrefixException, cc
@@ -146,27 +192,125 @@ def check_credit_card(ccnum, cctype=None):
     realLengths=length_for_prefix(prefix)
     if not realLengths or len(cc) not in realLengths:
         raise CreditCardFormatException, "bad length"
-    cc=map(int, list(cc))
-    cc.reverse()
-    s=0
-    for i in range(len(cc)):
-       s+=reduce(operator.add, divmod((1+(i%2))*cc[i], 10))
+    if digits_only:
+        s=luhn_checksum(cc)
+    else:
+        s=_legacy_luhn_checksum(cc)
     # apparently En Route, whatever that is, doesn't use the check bit
-    if foundtype!=EN_ROUTE and (s % 10) != 0:
+    if foundtype!=EN_ROUTE and s != 0:
         raise CreditCardFormatException, "wrong check digit"
 
-def _gen_fake(cctype,
-              start=None,
-              num=1,
-              prefix=None,
-              length=None):
+def check_credit_cards(numbers):
     """
-    generates valid test credit cards, for testing.
-    This isn't particularly efficient, as it simply
-    cycles through numbers in sequence and tests
-    them, rather than generating the check digits from
-    the rest of the number.  But I have no reason to make
-    this efficient.
+    the batch counterpart of check_credit_card(), for checking many
+    numbers at once; this requires numpy.  numbers may be a numpy
+    array of strings or any sequence of strings, and hyphens and
+    spaces are ignored, as they are by check_credit_card().
+
+    Returns a (types, length_ok, luhn_ok) triple of arrays with one
+    entry per number: the card type (None if the number has an
+    unknown prefix or characters other than digits), whether the
+    length is right for the prefix, and whether the check digit is
+    right (always true for En Route, which doesn't use one).  A
+    number passes check_credit_card() exactly when it has a type and
+    both flags are true.
+    """
+    if numpy is None:
+        raise RuntimeError, "numpy not installed, cannot check in batch"
+    numbers=numpy.asarray(numbers)
+    if numbers.dtype.kind not in 'SU':
+        numbers=numbers.astype(unicode)
+    for sep in ('-', ' '):
+        numbers=numpy.char.replace(numbers, sep, '')
+    if numbers.dtype.kind=='U':
+        # anything outside ascii can't be a digit anyway
+        numbers=numpy.char.encode(numbers, 'ascii', 'replace')
+    numbers=numpy.ascontiguousarray(numbers)
+    count=len(numbers)
+    width=numbers.dtype.itemsize
+    lengths=numpy.char.str_len(numbers)
+    chars=numbers.view(numpy.uint8).reshape(count, width)
+    columns=numpy.arange(width)
+    inside=columns < lengths[:, None]
+    digits=chars.astype(numpy.int16) - ord('0')
+    is_digit=(digits >= 0) & (digits <= 9)
+    chars_ok=(is_digit | ~inside).all(axis=1) & (lengths > 0)
+    digits=numpy.where(is_digit & inside, digits, 0)
+
+    # Luhn: double every second digit counting from the right
+    doubled=((lengths[:, None] - 1 - columns) % 2==1) & inside
+    luhn=numpy.where(doubled, _luhn_doubled.take(digits), digits)
+    luhn_ok=(luhn.sum(axis=1) % 10==0) & chars_ok
+
+    types=numpy.empty(count, dtype=object)
+    length_ok=numpy.zeros(count, dtype=bool)
+    unmatched=chars_ok.copy()
+    for prefix in prefixes:
+        n=len(prefix)
+        if n > width:
+            continue
+        match=unmatched & (lengths >= n)
+        match&=(chars[:, :n]==_prefix_bytes[prefix]).all(axis=1)
+        if not match.any():
+            continue
+        unmatched&=~match
+        cardtype=type_for_prefix(prefix)
+        types[match]=cardtype
+        length_ok[match]=numpy.in1d(lengths[match], length_for_prefix(prefix))
+        if cardtype==EN_ROUTE:
+            luhn_ok[match]=True
+    return types, length_ok, luhn_ok
+
+if numpy is not None:
+    _luhn_doubled=numpy.array([_luhn_even[str(d)] for d in range(10)])
+    _prefix_bytes=dict([(p, numpy.array([ord(c) for c in p],
+                                        dtype=numpy.uint8))
+                        for p in prefixes])
+
+
+def _luhn_weighted_sum(digits, offset):
+    # the Luhn sum of digits whose last digit sits at position offset
+    # counting from the right of the whole number (the check digit
+    # being at position 0)
+    if offset % 2:
+        odd, even=_luhn_even, _luhn_odd
+    else:
+        odd, even=_luhn_odd, _luhn_even
+    return (sum(map(odd.__getitem__, digits[::-2]))
+            + sum(map(even.__getitem__, digits[-2::-2])))
+
+_suffix_tables={}
+
+def _suffix_table(size):
+    # all suffixes of the given number of digits, in order, with
+    # their Luhn sums as the digits just before the check digit
+    try:
+        return _suffix_tables[size]
+    except KeyError:
+        fmt='%%0%dd' % size
+        table=[]
+        for i in xrange(10 ** size):
+            suffix=size and fmt % i or ''
+            table.append((suffix, _luhn_weighted_sum(suffix, 1)))
+        _suffix_tables[size]=table
+        return table
+
+def generate_cards(cctype,
+                   prefix=None,
+                   length=None,
+                   start=None,
+                   count=None,
+                   valid=True):
+    """
+    yields test credit card numbers of the given type, in increasing
+    order, computing each check digit directly.  prefix and length
+    default to the first ones listed for the card type; start, if
+    given, is the lowest number to produce, and count the most
+    numbers to produce (by default, all of them).
+
+    If valid is false, every number gets a deliberately wrong check
+    digit instead.  As En Route numbers have no check digit, this is
+    not possible for them.
     """
     if prefix is None:
         prefix=card_prefix_map[cctype][0]
@@ -177,26 +321,53 @@ def _gen_fake(cctype,
     elif length not in prefix_length_map[prefix]:
         raise ValueError, \
               "invalid length for card prefix %s: %s" % (prefix, length)
-    if start is None:
-        start='%s%s' % (prefix, '0' * (length-len(prefix)))
-    elif not (start.startswith(prefix) and len(start)==length):
+    if start is not None and not (start.startswith(prefix)
+                                  and len(start)==length
+                                  and _digitsRE.match(start)):
         raise ValueError, "starting value %s inconsistent with "\
               "prefix %s and length %s" % (start, prefix, length)
-    
-    res=[]
-    while 1:
-        if len(start)!=length or not start.startswith(prefix):
-            break
-        try:
-            check_credit_card(start, cctype)
-            res.append(start)
-            if num and len(res)>=num:
-                break
-        except CreditCardFormatException:
-            pass
-        start=str(long(start)+1)
-    return res
-
-        
-     
-    
+    if not valid and cctype==EN_ROUTE:
+        raise ValueError, "En Route numbers have no check digit"
+    return _generate_cards(prefix, length, start, count, valid)
+
+def _generate_cards(prefix, length, start, count, valid):
+    bodylen=length-len(prefix)-1
+    size=min(bodylen, 4)
+    suffixes=_suffix_table(size)
+    headlen=bodylen-size
+    headfmt='%%s%%0%dd' % headlen
+    if start is None:
+        first=0
+    else:
+        first=int(start[len(prefix):-1] or 0)
+    shift=valid and 10 or 11
+    produced=0
+    for high in xrange(first // len(suffixes), 10 ** headlen):
+        if headlen:
+            head=headfmt % (prefix, high)
+        else:
+            head=prefix
+        base=_luhn_weighted_sum(head, size + 1)
+        if high==first // len(suffixes):
+            block=suffixes[first % len(suffixes):]
+        else:
+            block=suffixes
+        for suffix, partial in block:
+            number='%s%s%d' % (head, suffix, (shift - (base + partial) % 10) % 10)
+            if start is not None and number < start:
+                continue
+            yield number
+            produced+=1
+            if count is not None and produced>=count:
+                return
+
+def _gen_fake(cctype,
+              start=None,
+              num=1,
+              prefix=None,
+              length=None):
+    """
+    generates valid test credit cards, for testing.
+    This is a list-returning wrapper around generate_cards().
+    """
+    return list(generate_cards(cctype, prefix, length, start, num or None))
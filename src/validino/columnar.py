@@ -0,0 +1,322 @@
+"""
+Column-at-a-time versions of some common validators, for validating
+tabular data without a Python call (and possibly an exception) per
+cell.  These require numpy.
+
+Each function takes a column -- a numpy array or any sequence -- and
+returns a (values, valid, errors) triple: the converted column as a
+numpy array, a boolean mask that is true for the rows that passed, and
+an object array holding, for each row that failed, the same message
+key the scalar validator would have used ('integer', 'min', 'max',
+'minlen', 'maxlen', 'belongs', 'parse_time'), and None elsewhere.
+
+Each also accepts a valid mask from a previous step; rows that are
+already invalid are passed through unchecked.  compose() chains steps
+in that way:
+
+>>> from validino.util import partial
+>>> values, valid, errors=compose(['4', 'x', '200'],
+...                               integer,
+...                               partial(clamp, min=0, max=130))
+"""
+
+try:
+    import numpy
+except ImportError:
+    numpy=None
+
+from validino.base import _msg
+from validino.timeformat import _tokenize, compile_format
+
+_INT64_MAX=2 ** 63 - 1
+
+__all__=['belongs',
+         'clamp',
+         'clamp_length',
+         'compose',
+         'error_messages',
+         'fail_rows',
+         'integer',
+         'parse_date',
+         'parse_datetime',
+         'prepare_column']
+
+
+def prepare_column(column, valid):
+    """
+    returns the column as a numpy array, a copy of the valid mask
+    (all true if it is None) and an empty errors column, for a
+    column validator to fill in.
+    """
+    if numpy is None:
+        raise RuntimeError, "numpy not installed, cannot validate columns"
+    values=numpy.asarray(column)
+    if valid is None:
+        valid=numpy.ones(len(values), dtype=bool)
+    else:
+        valid=numpy.array(valid, dtype=bool)
+    errors=numpy.empty(len(values), dtype=object)
+    return values, valid, errors
+
+
+def fail_rows(valid, errors, idx, key):
+    """
+    marks the rows selected by idx invalid, with the message key.
+    """
+    valid[idx]=False
+    errors[idx]=key
+
+
+def integer(column, valid=None):
+    """
+    coerces the column to integers.  String columns that convert
+    cleanly are converted in one go; otherwise each remaining cell is
+    converted as integer() would, and cells that do not convert are
+    marked with the 'integer' key.
+    """
+    values, valid, errors=prepare_column(column, valid)
+    kind=values.dtype.kind
+    # values that don't fit in an int64 are left to the per-cell path,
+    # which keeps them as Python longs, rather than wrapping around
+    if kind in 'ib' or (kind=='u' and values.dtype.itemsize < 8):
+        return values.astype(numpy.int64), valid, errors
+    if kind=='u':
+        if not (values[valid] > numpy.uint64(_INT64_MAX)).any():
+            return values.astype(numpy.int64), valid, errors
+    elif kind=='f':
+        bad=valid & ~numpy.isfinite(values)
+        fail_rows(valid, errors, bad, 'integer')
+        big=valid & ((values < -2.0 ** 63) | (values >= 2.0 ** 63))
+        if not big.any():
+            res=numpy.zeros(len(values), dtype=numpy.int64)
+            res[valid]=values[valid].astype(numpy.int64)
+            return res, valid, errors
+    if kind in 'SU':
+        idx=numpy.flatnonzero(valid)
+        res=numpy.zeros(len(values), dtype=numpy.int64)
+        try:
+            res[idx]=values[idx].astype(numpy.int64)
+        except (ValueError, OverflowError):
+            pass
+        else:
+            return res, valid, errors
+    res=numpy.zeros(len(values), dtype=object)
+    for i in numpy.flatnonzero(valid):
+        try:
+            res[i]=int(values[i])
+        except (TypeError, ValueError):
+            fail_rows(valid, errors, i, 'integer')
+    try:
+        res=res.astype(numpy.int64)
+    except OverflowError:
+        pass
+    return res, valid, errors
+
+
+def clamp(column, min=None, max=None, valid=None):
+    """
+    checks that the values in the column lie between minimum and
+    maximum values (either of which are optional).
+    """
+    values, valid, errors=prepare_column(column, valid)
+    for bound, key, fails in ((min, 'min', numpy.less),
+                              (max, 'max', numpy.greater)):
+        if bound is None:
+            continue
+        idx=numpy.flatnonzero(valid)
+        bad=numpy.asarray(fails(values[idx], bound), dtype=bool)
+        fail_rows(valid, errors, idx[bad], key)
+    return values, valid, errors
+
+
+def _lengths(values, idx):
+    if values.dtype.kind in 'SU':
+        return numpy.char.str_len(values[idx])
+    return numpy.fromiter((len(values[i]) for i in idx),
+                          dtype=numpy.int64,
+                          count=len(idx))
+
+
+def clamp_length(column, min=None, max=None, valid=None):
+    """
+    checks that the lengths of the values in the column lie between
+    minimum and maximum lengths (either of which are optional).
+    """
+    values, valid, errors=prepare_column(column, valid)
+    for bound, key, fails in ((min, 'minlen', numpy.less),
+                              (max, 'maxlen', numpy.greater)):
+        if bound is None:
+            continue
+        idx=numpy.flatnonzero(valid)
+        bad=fails(_lengths(values, idx), bound)
+        fail_rows(valid, errors, idx[bad], key)
+    return values, valid, errors
+
+
+def belongs(column, domain, valid=None):
+    """
+    checks that the values in the column belong to the domain
+    specified.
+    """
+    values, valid, errors=prepare_column(column, valid)
+    idx=numpy.flatnonzero(valid)
+    if values.dtype.kind=='O':
+        contains=numpy.frompyfunc(lambda v: v in domain, 1, 1)
+        ok=contains(values[idx]).astype(bool)
+    else:
+        ok=numpy.in1d(values[idx], list(domain))
+    fail_rows(valid, errors, idx[~ok], 'belongs')
+    return values, valid, errors
+
+
+# the range of each directive's two-digit form
+_ranges={'m' : (1, 12),
+         'd' : (1, 31),
+         'H' : (0, 23),
+         'M' : (0, 59),
+         'S' : (0, 61)}
+
+
+def _parse_fixed(values, format, datetimes):
+    """
+    parses string values written in the canonical fixed-width form of
+    format (see validino.timeformat) by picking the digits out of
+    their characters.  Returns a mask of the values handled -- those
+    with the right shape -- and, for those, the parsed datetime64
+    values and a mask of which were valid dates.
+    """
+    tokens=_tokenize(format)
+    width=0
+    for kind, t in tokens:
+        if kind=='lit':
+            width+=len(t)
+        else:
+            width+=(t=='Y' and 4 or 2)
+    if values.dtype.kind=='U':
+        chars=values.view(numpy.uint32)
+    else:
+        chars=values.view(numpy.uint8)
+    chars=chars.reshape(len(values), -1)
+    if chars.shape[1] < width:
+        return numpy.zeros(len(values), dtype=bool), None, None
+    chars=chars[:, :width].astype(numpy.int64)
+    shaped=numpy.char.str_len(values)==width
+    fields={}
+    pos=0
+    for kind, t in tokens:
+        if kind=='lit':
+            for c in t:
+                shaped&=chars[:, pos]==ord(c)
+                pos+=1
+            continue
+        w=(t=='Y' and 4 or 2)
+        digits=chars[:, pos:pos+w] - ord('0')
+        shaped&=((digits >= 0) & (digits <= 9)).all(axis=1)
+        fields[t]=numpy.dot(digits, 10 ** numpy.arange(w-1, -1, -1))
+        pos+=w
+    for t, (lo, hi) in _ranges.iteritems():
+        if t in fields:
+            shaped&=(fields[t] >= lo) & (fields[t] <= hi)
+    idx=numpy.flatnonzero(shaped)
+    def get(t, default):
+        if t in fields:
+            return fields[t][idx]
+        return default
+    if 'y' in fields:
+        year=fields['y'][idx]
+        year=year + numpy.where(year <= 68, 2000, 1900)
+    else:
+        year=get('Y', 1900)
+    year=numpy.broadcast_to(year, idx.shape)
+    month=get('m', 1)
+    day=get('d', 1)
+    months=((year - 1970) * 12 + (month - 1)).astype('datetime64[M]')
+    start=months.astype('datetime64[D]')
+    ndays=((months + 1).astype('datetime64[D]') - start).astype(numpy.int64)
+    ok=(year >= 1) & (day <= ndays)
+    res=start + (day - 1)
+    if datetimes:
+        seconds=get('H', 0) * 3600 + get('M', 0) * 60 + get('S', 0)
+        # strptime allows leap seconds, but datetime doesn't
+        ok&=get('S', 0) <= 59
+        res=res.astype('datetime64[s]') + seconds
+    return shaped, res, ok
+
+
+def _parse_times(column, format, valid, datetimes):
+    values, valid, errors=prepare_column(column, valid)
+    parser=compile_format(format)
+    if datetimes:
+        unit='s'
+        convert=parser.datetime
+    else:
+        unit='D'
+        convert=parser.date
+    res=numpy.empty(len(values), dtype='datetime64[%s]' % unit)
+    res[:]=numpy.datetime64('NaT')
+    todo=numpy.flatnonzero(valid)
+    if (len(todo)
+        and parser.directives is not None
+        and values.dtype.kind in 'SU'):
+        shaped, parsed, ok=_parse_fixed(values[todo], format, datetimes)
+        done=todo[shaped]
+        res[done[ok]]=parsed[ok]
+        fail_rows(valid, errors, done[~ok], 'parse_time')
+        todo=todo[~shaped]
+    for i in todo:
+        try:
+            res[i]=numpy.datetime64(convert(values[i]), unit)
+        except (TypeError, ValueError):
+            fail_rows(valid, errors, i, 'parse_time')
+    return res, valid, errors
+
+
+def parse_date(column, format, valid=None):
+    """
+    parses the dates in a column of strings according to the given
+    format, as parse_date() would, into a datetime64[D] array, with
+    NaT for the rows that fail.  Values written in the canonical
+    fixed-width form of the format (like '2007-03-04' for
+    '%Y-%m-%d') are parsed without a Python call per value.
+    """
+    return _parse_times(column, format, valid, False)
+
+
+def parse_datetime(column, format, valid=None):
+    """
+    like parse_date, but parses date times, as parse_datetime()
+    would, into a datetime64[s] array.
+    """
+    return _parse_times(column, format, valid, True)
+
+
+def compose(column, *validators):
+    """
+    applies each of a series of column validators in turn, passing
+    the converted values and validity mask of each to the next.  The
+    errors returned hold, for each invalid row, the key of the first
+    failure.
+    """
+    values, valid, errors=prepare_column(column, None)
+    for v in validators:
+        before=valid
+        values, valid, step_errors=v(values, valid=valid)
+        failed=before & ~valid
+        errors[failed]=step_errors[failed]
+    return values, valid, errors
+
+
+def error_messages(errors, msg=None):
+    """
+    turns an array of message keys, as returned by the column
+    validators, into an array of messages, looked up in msg (a
+    string, a dictionary, or None for the current message catalog)
+    as the scalar validators do.
+    """
+    if numpy is None:
+        raise RuntimeError, "numpy not installed, cannot validate columns"
+    res=numpy.empty(len(errors), dtype=object)
+    for i, key in enumerate(errors):
+        if key is not None:
+            res[i]=_msg(msg, key, key)
+    return res
@@ -2,100 +2,135 @@
 Some validators commonly used in web applications.
 """
 
-import httplib
 import re
-import socket
 import urlparse
 
-from validino.base import Invalid, _msg, regex
+try:
+    import numpy
+except ImportError:
+    numpy=None
+
+from validino.base import Failure, Validator, _add_error_message
 import validino.ccvalidate as _cc
-from validino.util import partial
+from validino.columnar import fail_rows, prepare_column
+from validino.resolver import DNS, ResolverError, get_default_resolver
+from validino.urlcheck import UrlCheckError, get_default_checker
 
 # lifted from formencode
 _usernameRE = re.compile(r"^[^ \t\n\r@<>()]+$", re.I)
 _domainRE = re.compile(r"^[a-z0-9][a-z0-9\.\-_]*\.[a-z]+$", re.I)
 
-try:
-    import DNS
-except ImportError:
-    DNS=None
-else:
-    DNS.DiscoverNameServers()
-
 __all__=['email',
          'credit_card',
          'ip',
-         'url']
+         'ip_in',
+         'ip_network',
+         'ip_not_in',
+         'ipv6',
+         'url',
+         'CreditCard',
+         'Email',
+         'Ip',
+         'IpIn',
+         'IpNetwork',
+         'IpNotIn',
+         'Ipv6',
+         'Url']
+
+
+class Email(Validator):
+    __slots__=_fields=('check_dns', 'msg', 'resolver')
 
+    def __init__(self, check_dns=False, msg=None, resolver=None):
+        if check_dns and resolver is None and DNS is None:
+            raise RuntimeError, "pyDNS not installed, cannot check DNS"
+        self.check_dns=check_dns
+        self.msg=msg
+        self.resolver=resolver
 
-def email(check_dns=False, msg=None):
-    if check_dns and DNS is None:
-        raise RuntimeError, "pyDNS not installed, cannot check DNS"
-    def f(value):
+    def result(self, value):
         try:
             username, domain=value.split('@', 1)
         except ValueError:
-            raise Invalid(_msg(f.msg,
-                               'email.format',
-                               'invalid format'))
+            return self._failure('email.format',
+                                 'invalid format')
         if not _usernameRE.match(username):
-            raise Invalid(_msg(f.msg,
-                               'email.username',
-                               'invalid username'))
+            return self._failure('email.username',
+                                 'invalid username')
         if not _domainRE.match(domain):
-            raise Invalid(_msg(f.msg,
-                               'email.domain',
-                               'invalid domain'))
+            return self._failure('email.domain',
+                                 'invalid domain')
         
-        if f.check_dns:
+        if self.check_dns:
+            resolver=self.resolver
+            if resolver is None:
+                resolver=get_default_resolver()
             try:
-                a=DNS.DnsRequest(domain, qtype='mx').req().answers
-                if not a:
-                    a=DNS.DnsRequest(domain, qtype='a').req().answers
-                dnsdomains=[x['data'] for x in a]
-	    except (socket.error, DNS.DNSError), e:
-		raise Invalid(_msg(f.msg,
-                                   'email.socket_error',
-                                   'socket error'))
+                dnsdomains=resolver.resolve(domain)
+            except ResolverError:
+                return self._failure('email.socket_error',
+                                     'socket error')
             if not dnsdomains:
-                raise Invalid(_msg(f.msg,
-                                   'email.domain_error',
-                                   'no such domain'))
+                return self._failure('email.domain_error',
+                                     'no such domain')
         return value
-    f.check_dns=check_dns
-    f.msg=msg
-    return f
 
+def email(check_dns=False, msg=None, resolver=None):
+    """
+    Returns a validator that checks the format of an email address
+    and, if check_dns is true, that its domain exists, using the
+    given resolver (see validino.resolver) or the default one.
+    """
+    return Email(check_dns, msg, resolver)
 
-def credit_card(types=None,
-                require_type=False,
-                msg=None,
-                cc_field='cc_number',
-                cc_type_field='cc_type'):
-    if types is None:
-        types=_cc.cards
-    def f(values):
+
+def _not_none(column):
+    return numpy.frompyfunc(lambda x: x is not None, 1, 1)(column).astype(bool)
+
+
+class CreditCard(Validator):
+    __slots__=_fields=('types',
+                       'require_type',
+                       'msg',
+                       'cc_field',
+                       'cc_type_field')
+
+    def __init__(self,
+                 types=None,
+                 require_type=False,
+                 msg=None,
+                 cc_field='cc_number',
+                 cc_type_field='cc_type'):
+        if types is None:
+            types=_cc.cards
+        self.types=types
+        self.require_type=require_type
+        self.msg=msg
+        self.cc_field=cc_field
+        self.cc_type_field=cc_type_field
+
+    def result(self, values):
         if isinstance(values, (list, tuple)):
             cardnumber, cc_type=values
         else:
             cardnumber, cc_type=values, None
 
-        exc=Invalid()
+        errors={}
         
-        type_ok=not f.require_type
+        type_ok=not self.require_type
         
-        if f.require_type and cc_type is None:
-            m=_msg(f.msg,
-                   "credit_card.require_type",
-                   "no credit card type specified")
-            exc.add_error_message(f.cc_type_field, m)
+        if self.require_type and cc_type is None:
+            key="credit_card.require_type"
+            m=self._message(key,
+                            "no credit card type specified")
+            _add_error_message(errors, self.cc_type_field, m)
 
             
-        elif not (cc_type is None) and cc_type not in f.types:
-            m=_msg(f.msg,
-                   "credit_card.type_check",
-                   "unrecognized credit card type")
-            exc.add_error_message(f.cc_type_field, m)
+        elif not (cc_type is None) and cc_type not in self.types:
+            key="credit_card.type_check"
+            m=self._message(key,
+                            "unrecognized credit card type")
+            _add_error_message(errors, self.cc_type_field, m)
 
         else:
             type_ok=True
@@ -106,80 +141,361 @@ def credit_card(types=None,
             else:
                 _cc.check_credit_card(cardnumber)
         except _cc.CreditCardValidationException:
-            m=_msg(f.msg,
-                   "credit_card.invalid",
-                   "invalid credit card number")
-            exc.add_error_message(f.cc_field, m)
+            key="credit_card.invalid"
+            m=self._message(key,
+                            "invalid credit card number")
+            _add_error_message(errors, self.cc_field, m)
 
-        if exc.errors:
-            raise exc
+        if errors:
+            return Failure(errors, key=key)
         else:
             return values
-    f.types=types
-    f.require_type=require_type
-    f.msg=msg
-    f.cc_field=cc_field
-    f.cc_type_field=cc_type_field
-    return f
+
+    def validate_column(self, numbers, cc_types=None, valid=None):
+        """
+        the batch form of this validator, built on
+        ccvalidate.check_credit_cards() and following the conventions
+        of validino.columnar: returns (values, valid, errors), where
+        errors holds the message key for the first problem found in
+        each invalid row.  cc_types, if given, is a column of card
+        types parallel to numbers.  Requires numpy.
+        """
+        values, valid, errors=prepare_column(numbers, valid)
+        types, length_ok, luhn_ok=_cc.check_credit_cards(values)
+        number_ok=_not_none(types) & length_ok & luhn_ok
+        if cc_types is None:
+            if self.require_type:
+                fail_rows(valid, errors, valid.copy(),
+                          "credit_card.require_type")
+        else:
+            cc_types=numpy.asarray(cc_types, dtype=object)
+            given=_not_none(cc_types)
+            if self.require_type:
+                fail_rows(valid, errors, valid & ~given,
+                          "credit_card.require_type")
+            known=numpy.frompyfunc(self.types.__contains__, 1, 1)
+            known=known(cc_types).astype(bool)
+            fail_rows(valid, errors, valid & given & ~known,
+                  "credit_card.type_check")
+            # as with a single number, the type is only checked
+            # against the number if it is acceptable itself
+            number_ok&=~(given & known) | (types==cc_types)
+        fail_rows(valid, errors, valid & ~number_ok, "credit_card.invalid")
+        return values, valid, errors
+
+def credit_card(types=None,
+                require_type=False,
+                msg=None,
+                cc_field='cc_number',
+                cc_type_field='cc_type'):
+    return CreditCard(types, require_type, msg, cc_field, cc_type_field)
                                
-_ip_pat='^%s$' % r'\.'.join(['|'.join([str(x) for x in range(256)]*4)])
+_ipv4RE=re.compile(r'^([0-9]{1,3})\.([0-9]{1,3})\.([0-9]{1,3})\.([0-9]{1,3})\Z')
+_hexgroupRE=re.compile(r'^[0-9a-fA-F]{1,4}\Z')
+_prefixlenRE=re.compile(r'^[0-9]{1,3}\Z')
 
-ip=partial(regex, _ip_pat)
-ip.__doc__="""
+def _parse_ipv4(value):
+    """
+    returns a dotted-quad address as an integer, or None if it is
+    malformed.  Octets with leading zeros are not accepted.
+    """
+    m=_ipv4RE.match(value)
+    if not m:
+        return None
+    n=0
+    for octet in m.groups():
+        if len(octet)>1 and octet[0]=='0':
+            return None
+        octet=int(octet)
+        if octet>255:
+            return None
+        n=(n << 8) | octet
+    return n
 
-Returns a validator that tests whether an ip address is properly formed.
+def _ipv6_groups(text, allow_ipv4):
+    if not text:
+        return []
+    groups=text.split(':')
+    if allow_ipv4 and '.' in groups[-1]:
+        v4=_parse_ipv4(groups[-1])
+        if v4 is None:
+            return None
+        groups[-1:]=['%x' % (v4 >> 16), '%x' % (v4 & 0xffff)]
+    for g in groups:
+        if not _hexgroupRE.match(g):
+            return None
+    return groups
 
-"""
+def _parse_ipv6(value):
+    """
+    returns an IPv6 address (in any of the usual textual forms,
+    including '::' abbreviation and a trailing dotted quad) as an
+    integer, or None if it is malformed.
+    """
+    parts=value.split('::')
+    if len(parts)>2:
+        return None
+    if len(parts)==2:
+        head=_ipv6_groups(parts[0], False)
+        tail=_ipv6_groups(parts[1], True)
+        if head is None or tail is None:
+            return None
+        missing=8-len(head)-len(tail)
+        if missing<1:
+            return None
+        groups=head + ['0'] * missing + tail
+    else:
+        groups=_ipv6_groups(value, True)
+        if groups is None or len(groups)!=8:
+            return None
+    n=0
+    for g in groups:
+        n=(n << 16) | int(g, 16)
+    return n
 
-def url(check_exists=False,
-        schemas=('http', 'https'),
-        default_schema='http',
-        default_host='',
-        msg=None):
+def _parse_address(value):
+    """
+    returns (bits, address) for an IPv4 (bits=32) or IPv6 (bits=128)
+    address, or None if it is neither.
+    """
+    if not isinstance(value, basestring):
+        return None
+    n=_parse_ipv4(value)
+    if n is not None:
+        return 32, n
+    n=_parse_ipv6(value)
+    if n is not None:
+        return 128, n
+    return None
+
+def _parse_network(value):
+    """
+    returns (bits, prefixlen, network) for a network in CIDR notation
+    (a bare address is taken to be a network of one), or None if it
+    is malformed or has bits set beyond the prefix.
+    """
+    if not isinstance(value, basestring):
+        return None
+    address, sep, prefixlen=value.partition('/')
+    parsed=_parse_address(address)
+    if parsed is None:
+        return None
+    bits, n=parsed
+    if sep:
+        if not _prefixlenRE.match(prefixlen):
+            return None
+        prefixlen=int(prefixlen)
+        if prefixlen>bits:
+            return None
+    else:
+        prefixlen=bits
+    if n & ((1 << (bits-prefixlen)) - 1):
+        return None
+    return bits, prefixlen, n
+
+
+class Ip(Validator):
+    __slots__=_fields=('msg',)
+
+    def __init__(self, msg=None):
+        self.msg=msg
+
+    def result(self, value):
+        if not isinstance(value, basestring) or _parse_ipv4(value) is None:
+            return self._failure('ip',
+                                 'invalid ip address')
+        return value
 
-    def f(value):
-        if f.check_exists and set(f.schemas).difference(set(('http', 'https'))):
+def ip(msg=None):
+    """
+    Returns a validator that tests whether an (IPv4, dotted quad) ip
+    address is properly formed.
+    """
+    return Ip(msg)
+
+
+class Ipv6(Validator):
+    __slots__=_fields=('msg',)
+
+    def __init__(self, msg=None):
+        self.msg=msg
+
+    def result(self, value):
+        if not isinstance(value, basestring) or _parse_ipv6(value) is None:
+            return self._failure('ipv6',
+                                 'invalid ipv6 address')
+        return value
+
+def ipv6(msg=None):
+    """
+    Returns a validator that tests whether an IPv6 address is
+    properly formed.
+    """
+    return Ipv6(msg)
+
+
+class IpNetwork(Validator):
+    __slots__=_fields=('msg',)
+
+    def __init__(self, msg=None):
+        self.msg=msg
+
+    def result(self, value):
+        if _parse_network(value) is None:
+            return self._failure('ip_network',
+                                 'invalid network')
+        return value
+
+def ip_network(msg=None):
+    """
+    Returns a validator that tests whether the value is an IPv4 or
+    IPv6 network in CIDR notation (e.g., '10.0.0.0/8'), with no bits
+    set beyond the prefix.
+    """
+    return IpNetwork(msg)
+
+
+class _NetworkIndex(object):
+    """
+    a set of networks indexed by prefix length, so that testing an
+    address costs one set lookup per distinct prefix length rather
+    than one comparison per network.
+    """
+    def __init__(self, networks):
+        tables={32 : {}, 128 : {}}
+        for spec in networks:
+            parsed=_parse_network(spec)
+            if parsed is None:
+                raise ValueError("invalid network: %r" % (spec,))
+            bits, prefixlen, n=parsed
+            shift=bits-prefixlen
+            tables[bits].setdefault(shift, set()).add(n >> shift)
+        self._tables=dict([(bits, sorted(t.items()))
+                           for bits, t in tables.iteritems()])
+
+    def __contains__(self, address):
+        bits, n=address
+        for shift, prefixes in self._tables[bits]:
+            if (n >> shift) in prefixes:
+                return True
+        return False
+
+
+class IpIn(Validator):
+    __slots__=('networks', 'msg', '_index')
+    _fields=('networks', 'msg')
+
+    def __init__(self, networks, msg=None):
+        self.networks=tuple(networks)
+        self.msg=msg
+        self._index=_NetworkIndex(self.networks)
+
+    def result(self, value):
+        address=_parse_address(value)
+        if address is None:
+            return self._failure('ip',
+                                 'invalid ip address')
+        if address not in self._index:
+            return self._failure('ip_in',
+                                 'address not allowed')
+        return value
+
+def ip_in(networks, msg=None):
+    """
+    Returns a validator that tests whether an IPv4 or IPv6 address
+    belongs to one of the given networks (strings in CIDR notation,
+    or bare addresses).  Large lists of networks are fine; the cost
+    of a check depends only on how many distinct prefix lengths they
+    use.
+    """
+    return IpIn(networks, msg)
+
+
+class IpNotIn(IpIn):
+    __slots__=()
+
+    def result(self, value):
+        address=_parse_address(value)
+        if address is None:
+            return self._failure('ip',
+                                 'invalid ip address')
+        if address in self._index:
+            return self._failure('ip_not_in',
+                                 'address not allowed')
+        return value
+
+def ip_not_in(networks, msg=None):
+    """
+    like ip_in, but tests that the address does not belong to any of
+    the given networks, as for a blocklist.
+    """
+    return IpNotIn(networks, msg)
+
+
+class Url(Validator):
+    __slots__=_fields=('check_exists',
+                       'schemas',
+                       'default_schema',
+                       'default_host',
+                       'msg',
+                       'checker')
+
+    def __init__(self,
+                 check_exists=False,
+                 schemas=('http', 'https'),
+                 default_schema='http',
+                 default_host='',
+                 msg=None,
+                 checker=None):
+        self.check_exists=check_exists
+        self.schemas=schemas
+        self.default_schema=default_schema
+        self.default_host=default_host
+        self.msg=msg
+        self.checker=checker
+
+    def result(self, value):
+        if self.check_exists and set(self.schemas).difference(set(('http', 'https'))):
             m="existence check not supported for schemas other than http and https"
             raise RuntimeError(m)        
         schema, netloc, path, params, query, fragment=urlparse.urlparse(value)
-        if schema not in f.schemas:
-            raise Invalid(_msg(f.msg,
-                               "url.schema",
-                               "schema not allowed"))
-        if schema=='' and f.default_schema:
-            schema=f.default_schema
-        if netloc=='' and f.default_host:
-            netloc=f.default_host
+        if schema not in self.schemas:
+            return self._failure("url.schema",
+                                 "schema not allowed")
+        if schema=='' and self.default_schema:
+            schema=self.default_schema
+        if netloc=='' and self.default_host:
+            netloc=self.default_host
 
 
         url=urlparse.urlunparse((schema, netloc, path, params, query, fragment))
-        if f.check_exists:
-            newpath=urlparse.urlunparse(('', '', path, params, query, fragment))
-            if schema=='http':
-                conn=httplib.HTTPConnection
-            elif schema=='https':
-                conn=httplib.HTTPSConnection
-            else:
-                assert False, "not reached"
+        if self.check_exists:
+            checker=self.checker
+            if checker is None:
+                checker=get_default_checker()
             try:
-                c=conn(netloc)
-                c.request('HEAD', newpath)
-                res=c.getresponse()
-            except (httplib.HTTPException, socket.error), e:
-                raise Invalid(_msg(f.msg,
-                                   "url.http_error",
-                                   "http error"))
-            else:
-                if 200 <= res.status < 400:
-                    # this fudges on redirects.  
-                    return url
-                raise Invalid(_msg(f.msg,
-                                   'url.not_exists',
-                                   "url not OK"))
+                status=checker.status(url)
+            except UrlCheckError:
+                return self._failure("url.http_error",
+                                     "http error")
+            if 200 <= status < 400:
+                # this fudges on redirects.  
+                return url
+            return self._failure('url.not_exists',
+                                 "url not OK")
         return url
-    f.default_schema=default_schema
-    f.default_host=default_host
-    f.check_exists=check_exists
-    f.schemas=schemas
-    f.msg=msg
-    return f
+
+def url(check_exists=False,
+        schemas=('http', 'https'),
+        default_schema='http',
+        default_host='',
+        msg=None,
+        checker=None):
+    """
+    checks that the value is a url with an allowed schema, filling
+    in the default schema and host if missing.  If check_exists is
+    true, also checks with a HEAD request that the url exists, using
+    checker (a validino.urlcheck.UrlChecker), or the default checker,
+    which pools connections and caches statuses.
+    """
+    return Url(check_exists, schemas, default_schema, default_host, msg, checker)
@@ -22,6 +22,9 @@ class Field(object):
             return V.compose(*validators)
 
     def __getattr__(self, k):
+        if k=='_attributes':
+            # not yet set, e.g. while unpickling
+            raise AttributeError(k)
         try:
             return self._attributes[k]
         except KeyError:
@@ -30,6 +33,17 @@ class Field(object):
     def __call__(self, data):
         return self._validator(data)
 
+    __call__.result_call=True
+
+    def result(self, data):
+        if V.calls_result(self):
+            return self._validator.result(data)
+        # a subclass's own __call__ comes first
+        try:
+            return self(data)
+        except V.Invalid, e:
+            return V.Failure.wrap(e)
+
 
 class DateField(Field):
 
@@ -0,0 +1,158 @@
+"""
+Timing instrumentation for schemas.
+
+FieldTimings is a schema observer (see Schema.add_observer() and
+add_observer()) that keeps a latency histogram for each key of the
+schemas it observes, to find out which fields are slow:
+
+>>> import validino as V
+>>> from validino.instrument import FieldTimings
+>>> timings=FieldTimings()
+>>> s=V.Schema(dict(age=V.integer()))
+>>> s.add_observer(timings)
+>>> s(dict(age='42'))
+{'age': 42}
+>>> timings['age'].count
+1
+>>> report=timings.report()
+"""
+
+from bisect import bisect_left
+from threading import Lock
+
+__all__=['FieldTimings',
+         'Histogram']
+
+
+def _default_bounds():
+    # one microsecond to about 17 seconds, in powers of two
+    return tuple([2 ** i / 1e6 for i in range(25)])
+
+
+class Histogram(object):
+    """
+    counts of observed durations, in seconds, in buckets with the
+    given upper bounds, plus one for anything longer.
+    """
+    __slots__=('bounds', 'counts', 'count', 'failures', 'total', 'max')
+
+    def __init__(self, bounds):
+        self.bounds=bounds
+        self.counts=[0] * (len(bounds) + 1)
+        self.count=0
+        self.failures=0
+        self.total=0.0
+        self.max=0.0
+
+    def add(self, seconds, ok=True):
+        self.counts[bisect_left(self.bounds, seconds)]+=1
+        self.count+=1
+        if not ok:
+            self.failures+=1
+        self.total+=seconds
+        if seconds > self.max:
+            self.max=seconds
+
+    def mean(self):
+        if not self.count:
+            return 0.0
+        return self.total / self.count
+
+    def percentile(self, q):
+        """
+        returns the upper bound of the bucket holding the qth
+        quantile (0 <= q <= 1), or the longest time observed if that
+        lies beyond the last bucket.
+        """
+        if not self.count:
+            return 0.0
+        rank=max(1, q * self.count)
+        seen=0
+        for bound, n in zip(self.bounds, self.counts):
+            seen+=n
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def copy(self):
+        h=Histogram(self.bounds)
+        h.counts=self.counts[:]
+        h.count=self.count
+        h.failures=self.failures
+        h.total=self.total
+        h.max=self.max
+        return h
+
+
+class FieldTimings(object):
+    """
+    a schema observer keeping a Histogram of the time taken by each
+    key (singular or plural) of the schemas it observes.  Keys of
+    different schemas that are the same are counted together; use
+    one FieldTimings per schema to keep them apart.
+    """
+
+    def __init__(self, bounds=None):
+        if bounds is None:
+            bounds=_default_bounds()
+        self.bounds=tuple(bounds)
+        self._histograms={}
+        self._lock=Lock()
+
+    def __call__(self, schema, key, seconds, ok, message_key):
+        self._lock.acquire()
+        try:
+            try:
+                h=self._histograms[key]
+            except KeyError:
+                h=self._histograms[key]=Histogram(self.bounds)
+            h.add(seconds, ok)
+        finally:
+            self._lock.release()
+
+    def __getitem__(self, key):
+        self._lock.acquire()
+        try:
+            return self._histograms[key].copy()
+        finally:
+            self._lock.release()
+
+    def histograms(self):
+        """
+        returns a dictionary mapping each key seen to a copy of its
+        Histogram.
+        """
+        self._lock.acquire()
+        try:
+            return dict([(k, h.copy()) for k, h in self._histograms.iteritems()])
+        finally:
+            self._lock.release()
+
+    def reset(self):
+        self._lock.acquire()
+        try:
+            self._histograms.clear()
+        finally:
+            self._lock.release()
+
+    def report(self, limit=None):
+        """
+        returns a table of the keys seen, those taking the most time
+        in total first, with their call and failure counts and mean,
+        median, 99th percentile and maximum times in microseconds.
+        """
+        rows=sorted(self.histograms().iteritems(),
+                    key=lambda x: x[1].total,
+                    reverse=True)
+        if limit is not None:
+            rows=rows[:limit]
+        lines=["%-30s %9s %9s %10s %10s %10s %10s" % ('key', 'calls',
+                                                     'failures', 'mean us',
+                                                     'p50 us', 'p99 us',
+                                                     'max us')]
+        for key, h in rows:
+            lines.append("%-30s %9d %9d %10.1f %10.1f %10.1f %10.1f" % (
+                key, h.count, h.failures, h.mean() * 1e6,
+                h.percentile(0.5) * 1e6, h.percentile(0.99) * 1e6,
+                h.max * 1e6))
+        return '\n'.join(lines)
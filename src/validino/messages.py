@@ -1,4 +1,5 @@
 
+from itertools import count
 from threading import local
 from pkg_resources import resource_stream
 
@@ -13,16 +14,32 @@ def loadMessages(relative_to=__name__, location='messages.txt'):
         d[key]=value
     return d
 
-_messagelocal=local()
-_messagelocal.messages=loadMessages()
+_defaultMessages=loadMessages()
+
+# every installation of a message catalog gets a new generation
+# number, which validators use to tell whether the message text they
+# have cached is still current.  Catalogs should therefore be swapped
+# with setMessages() or msg() rather than modified in place.
+_generations=count(1)
+
+class _MessageLocal(local):
+    def __init__(self):
+        self.messages=_defaultMessages
+        self.generation=0
+
+_messagelocal=_MessageLocal()
 
 def getMessages():
     return _messagelocal.messages
 
+def getGeneration():
+    return _messagelocal.generation
+
 def setMessages(messages):
     _messagelocal.messages=messages
+    _messagelocal.generation=_generations.next()
 
-__all__=['getMessages', 'setMessages', 'loadMessages']
+__all__=['getMessages', 'getGeneration', 'setMessages', 'loadMessages']
 
 try:
     from contextlib import contextmanager
@@ -32,11 +49,11 @@ else:
     @contextmanager
     def msg(messages):
         oldmessages=_messagelocal.messages
-        _messagelocal.messages=messages
+        setMessages(messages)
         try:
             yield
         finally:
-            _messagelocal.messages=oldmessages
+            setMessages(oldmessages)
             
     __all__.append('msg')
     
@@ -0,0 +1,181 @@
+"""
+Failure-rate metrics for schemas, with Prometheus text export.
+
+Metrics is a schema observer (see add_observer()) that counts the
+steps validated for each key, the failures for each key, and the
+failures for each message key ('notempty', 'email.domain', ...),
+across all the schemas it observes.  Each thread counts into its own
+dictionary, without locking; the counts are summed when read, and
+those of threads that have finished are folded into a shared total,
+so that their dictionaries don't pile up.
+
+>>> from validino import metrics
+>>> metrics.enable()
+>>> # ... validate things ...
+>>> text=metrics.render()
+>>> metrics.disable()
+"""
+
+from threading import Lock, current_thread, local
+
+from validino.base import add_observer, remove_observer
+
+__all__=['Metrics',
+         'default_metrics',
+         'disable',
+         'enable',
+         'render']
+
+_VALIDATIONS, _FAILURES, _MESSAGE_FAILURES=range(3)
+
+_families=(
+    (_VALIDATIONS,
+     'validations_total',
+     'field',
+     'Schema steps validated, by field.'),
+    (_FAILURES,
+     'failures_total',
+     'field',
+     'Schema steps that failed, by field.'),
+    (_MESSAGE_FAILURES,
+     'message_failures_total',
+     'message_key',
+     'Schema steps that failed, by message key.'),
+    )
+
+
+def _label(key):
+    if key is None:
+        return 'unknown'
+    if isinstance(key, (list, tuple)):
+        return ','.join(['%s' % k for k in key])
+    return '%s' % key
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Metrics(object):
+    """
+    counts validations and failures by key, and failures by message
+    key, for the schemas it observes.
+    """
+
+    def __init__(self):
+        self._local=local()
+        # (thread, counts) pairs for the threads counting, and the
+        # counts of those that have finished
+        self._threads=[]
+        self._total={}
+        self._lock=Lock()
+
+    def _reap(self):
+        # a finished thread can't count any more, so its dictionary
+        # can be folded into the total; the lock must be held
+        live=[]
+        total=self._total
+        for thread, counts in self._threads:
+            if thread.is_alive():
+                live.append((thread, counts))
+            else:
+                for k, n in counts.iteritems():
+                    total[k]=total.get(k, 0) + n
+        self._threads=live
+
+    def _counts(self):
+        counts={}
+        self._lock.acquire()
+        try:
+            self._reap()
+            self._threads.append((current_thread(), counts))
+        finally:
+            self._lock.release()
+        self._local.counts=counts
+        return counts
+
+    def __call__(self, schema, key, seconds, ok, message_key):
+        try:
+            counts=self._local.counts
+        except AttributeError:
+            counts=self._counts()
+        k=(_VALIDATIONS, key)
+        counts[k]=counts.get(k, 0) + 1
+        if not ok:
+            k=(_FAILURES, key)
+            counts[k]=counts.get(k, 0) + 1
+            k=(_MESSAGE_FAILURES, message_key)
+            counts[k]=counts.get(k, 0) + 1
+
+    def counts(self):
+        """
+        returns the counts summed over all threads, as a dictionary
+        of dictionaries: validations and failures by key, and
+        failures by message key.
+        """
+        self._lock.acquire()
+        try:
+            self._reap()
+            threads=[self._total.copy()]
+            threads.extend([counts for thread, counts in self._threads])
+        finally:
+            self._lock.release()
+        res=[{}, {}, {}]
+        for counts in threads:
+            # items() copies, so other threads may go on counting
+            for (kind, key), n in counts.items():
+                d=res[kind]
+                d[key]=d.get(key, 0) + n
+        return dict(validations=res[_VALIDATIONS],
+                    failures=res[_FAILURES],
+                    message_failures=res[_MESSAGE_FAILURES])
+
+    def reset(self):
+        self._lock.acquire()
+        try:
+            self._reap()
+            self._total.clear()
+            for thread, counts in self._threads:
+                counts.clear()
+        finally:
+            self._lock.release()
+
+    def render(self, prefix='validino'):
+        """
+        returns the counts in the Prometheus text exposition format.
+        """
+        counts=self.counts()
+        res=[counts['validations'],
+             counts['failures'],
+             counts['message_failures']]
+        lines=[]
+        for kind, name, label, help in _families:
+            name='%s_%s' % (prefix, name)
+            lines.append('# HELP %s %s' % (name, help))
+            lines.append('# TYPE %s counter' % name)
+            samples=sorted([(_label(k), n) for k, n in res[kind].iteritems()])
+            for value, n in samples:
+                lines.append('%s{%s="%s"} %d' % (name, label, _escape(value), n))
+        return '\n'.join(lines) + '\n'
+
+
+default_metrics=Metrics()
+_enabled=False
+
+def enable():
+    """
+    starts counting for all schemas into default_metrics.
+    """
+    global _enabled
+    if not _enabled:
+        add_observer(default_metrics)
+        _enabled=True
+
+def disable():
+    global _enabled
+    if _enabled:
+        remove_observer(default_metrics)
+        _enabled=False
+
+def render(prefix='validino'):
+    return default_metrics.render(prefix)
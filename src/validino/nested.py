@@ -0,0 +1,340 @@
+"""
+A schema whose keys are paths into nested data.
+"""
+
+from validino.base import Failure, Schema, as_result, compose
+
+__all__=['NestedSchema']
+
+# the path element that matches every key or index at its level
+WILDCARD='*'
+
+# marks the end of a path in the trie of schema paths
+_END=None
+
+_missing=object()
+
+
+def _walk(data, segs):
+    """
+    follows a path down through nested dictionaries and lists.
+    """
+    cur=data
+    for seg in segs:
+        if isinstance(cur, dict):
+            cur=cur.get(seg, _missing)
+            if cur is _missing:
+                break
+        elif isinstance(cur, (list, tuple)) and seg.isdigit():
+            try:
+                cur=cur[int(seg)]
+            except IndexError:
+                return _missing
+        else:
+            return _missing
+    return cur
+
+
+def _iter_paths(data, separator):
+    """
+    yields the path of each value in nested data, as iter_unnest()
+    does, but going into lists as well, with their indices for path
+    elements.
+    """
+    stack=[(None, data.iteritems())]
+    while stack:
+        prefix, items=stack[-1]
+        for k, v in items:
+            if prefix is not None:
+                k="%s%s%s" % (prefix, separator, k)
+            if isinstance(v, dict):
+                stack.append((k, v.iteritems()))
+                break
+            if isinstance(v, (list, tuple)):
+                stack.append((k, enumerate(v)))
+                break
+            yield k
+        else:
+            stack.pop()
+
+
+class NestedSchema(Schema):
+    """
+    like Schema, but the keys of the subvalidator dictionary are paths
+    into nested data: strings like 'address.zip', with path elements
+    delimited by the given separator.  A path element of '*' matches
+    every key of a dictionary, or every index of a list, at that
+    level, so that 'items.*.qty' validates the qty of each item in a
+    repeated group (or passes None for items that lack one).  Plural
+    keys are tuples of paths, and their wildcards are bound together:
+    ('items.*.qty', 'items.*.price') is passed the qty and price of
+    one item at a time.
+
+    The data may be flat, with paths for keys ('items.0.qty', as
+    submitted by a form), nested (dictionaries and lists, as decoded
+    from JSON), or a mixture of the two.  Values are looked up in
+    place, without nesting or unnesting the data first.
+
+    The converted dictionary returned is flat, keyed by the full path
+    of each value validated (dict_nest() will nest it), and errors are
+    keyed by full path in the same way.
+
+    With allow_missing=False, a path with wildcards must be present
+    for each binding of its wildcards found in the data: 'items.*.qty'
+    requires a qty in every item, but an empty or absent list of items
+    is missing nothing.
+
+    With skip_failed, a plural step is skipped for each binding of its
+    wildcards in which one of its paths has failed its own step.
+    """
+    def __init__(self,
+                 subvalidators,
+                 msg=None,
+                 allow_missing=True,
+                 allow_extra=True,
+                 separator='.',
+                 skip_failed=False):
+        self.separator=separator
+        Schema.__init__(self, subvalidators, msg, allow_missing, allow_extra,
+                        skip_failed)
+
+    def _compile(self):
+        """
+        builds the execution plan walked by result(), as
+        Schema._compile() does, and a trie of all the paths in the
+        schema, used to find the keys or indices the wildcards match
+        in flat data and to spot extra keys.
+        """
+        sep=self.separator
+        singular=[]
+        plural=[]
+        trie={}
+        for k in self._subvalidators:
+            if isinstance(k, (list, tuple)):
+                plural.append(k)
+                paths=k
+            else:
+                singular.append(k)
+                paths=(k,)
+            for path in paths:
+                node=trie
+                for seg in path.split(sep):
+                    node=node.setdefault(seg, {})
+                node[_END]=True
+        plan=[]
+        fixed=[]
+        for k in sorted(singular) + sorted(plural):
+            vfunc=self._subvalidators[k]
+            if isinstance(vfunc, (list, tuple)):
+                vfunc=compose(*vfunc)
+            have_plural=isinstance(k, (list, tuple))
+            if have_plural:
+                keys=tuple(k)
+            else:
+                keys=(k,)
+            patterns=tuple([key.split(sep) for key in keys])
+            counts=set([p.count(WILDCARD) for p in patterns])
+            counts.discard(0)
+            if len(counts) > 1:
+                raise ValueError("paths in %r have different numbers "
+                                 "of wildcards" % (k,))
+            wild=bool(counts)
+            if not wild:
+                fixed.extend(zip(keys, patterns))
+            plan.append((k, as_result(vfunc), have_plural, keys, patterns,
+                         wild))
+        self._plan=tuple(plan)
+        self._schemakeys=frozenset([key for step in plan for key in step[3]])
+        self._trie=trie
+        self._fixed=tuple(fixed)
+        self._wild=len(fixed) < len(self._schemakeys)
+
+    def __getstate__(self):
+        state=Schema.__getstate__(self)
+        del state['_trie'], state['_fixed'], state['_wild']
+        return state
+
+    def _lookup(self, data, key, segs):
+        v=data.get(key, _missing)
+        if v is _missing and len(segs) > 1:
+            v=_walk(data, segs)
+        return v
+
+    def _known(self, key):
+        """
+        whether a path in the data is, leads to, or lies within a
+        path in the schema.
+        """
+        nodes=[self._trie]
+        for seg in ('%s' % key).split(self.separator):
+            nxt=[]
+            for node in nodes:
+                if _END in node:
+                    return True
+                for child in (node.get(seg), node.get(WILDCARD)):
+                    if child is not None:
+                        nxt.append(child)
+            if not nxt:
+                return False
+            nodes=nxt
+        return True
+
+    def _groups(self, data):
+        """
+        finds, for flat data, the path elements that each wildcard in
+        the schema matches, as a dictionary mapping the path leading
+        up to a wildcard to the set of elements found after it.
+        """
+        sep=self.separator
+        groups={}
+        for k in data:
+            if not isinstance(k, basestring) or sep not in k:
+                continue
+            segs=k.split(sep)
+            nodes=[self._trie]
+            for i, seg in enumerate(segs):
+                nxt=[]
+                for node in nodes:
+                    child=node.get(seg)
+                    if child is not None:
+                        nxt.append(child)
+                    child=node.get(WILDCARD)
+                    if child is not None:
+                        groups.setdefault(sep.join(segs[:i]), set()).add(seg)
+                        nxt.append(child)
+                if not nxt:
+                    break
+                nodes=nxt
+        return groups
+
+    def _children(self, data, groups, segs):
+        names=set(groups.get(self.separator.join(segs), ()))
+        container=_walk(data, segs)
+        if isinstance(container, dict):
+            names.update([k for k in container if isinstance(k, basestring)])
+        elif isinstance(container, (list, tuple)):
+            names.update([str(i) for i in xrange(len(container))])
+        return sorted(names)
+
+    def _bindings(self, data, groups, pattern):
+        """
+        returns the tuples of path elements the wildcards in pattern
+        match in the data.
+        """
+        found=[([], ())]
+        for seg in pattern:
+            if seg==WILDCARD:
+                found=[(segs + [c], bound + (c,))
+                       for segs, bound in found
+                       for c in self._children(data, groups, segs)]
+            else:
+                found=[(segs + [seg], bound) for segs, bound in found]
+        return [bound for segs, bound in found]
+
+    def _instances(self, data, groups, patterns):
+        """
+        yields the (keys, paths) to validate together for a step whose
+        paths contain wildcards, one for each way of binding them.
+        """
+        sep=self.separator
+        first=[p for p in patterns if WILDCARD in p][0]
+        for bound in self._bindings(data, groups, first):
+            paths=[]
+            for p in patterns:
+                path=[]
+                i=0
+                for seg in p:
+                    if seg==WILDCARD:
+                        seg=bound[i]
+                        i+=1
+                    path.append(seg)
+                paths.append(path)
+            yield tuple([sep.join(p) for p in paths]), paths
+
+    def _has_missing(self, data, groups):
+        """
+        whether any path in the schema, or any binding of one with
+        wildcards, is missing from the data.
+        """
+        for key, segs in self._fixed:
+            if self._lookup(data, key, segs) is _missing:
+                return True
+        if self._wild:
+            for step in self._plan:
+                if not step[5]:
+                    continue
+                for ikeys, paths in self._instances(data, groups, step[4]):
+                    for key, segs in zip(ikeys, paths):
+                        if self._lookup(data, key, segs) is _missing:
+                            return True
+        return False
+
+    def result(self, data):
+        """
+        validates data in exception-free mode, returning either the
+        converted dictionary or a Failure, as Schema.result() does.
+        """
+        res={}
+        failures={}
+        if not self.allow_extra:
+            for k in _iter_paths(data, self.separator):
+                if not self._known(k):
+                    return self._failure('schema.extra',
+                                         'extra keys in input')
+        groups={}
+        if self._wild:
+            groups=self._groups(data)
+        if not self.allow_missing and self._has_missing(data, groups):
+            return self._failure('schema.missing',
+                                 'missing keys in input')
+
+        skip=self.skip_failed
+        failed=set()
+        for k, vfunc, have_plural, keys, patterns, wild in self._steps():
+            if wild:
+                instances=self._instances(data, groups, patterns)
+            else:
+                instances=((keys, patterns),)
+            for ikeys, paths in instances:
+                if (have_plural and skip and failed
+                    and failed.intersection(ikeys)):
+                    failed.update(ikeys)
+                    continue
+                values=[]
+                for key, segs in zip(ikeys, paths):
+                    v=res.get(key, _missing)
+                    if v is _missing:
+                        v=self._lookup(data, key, segs)
+                        if v is _missing:
+                            v=None
+                    values.append(v)
+                if have_plural:
+                    vdata=tuple(values)
+                else:
+                    vdata=values[0]
+                try:
+                    tmp=vfunc(vdata)
+                except Exception, e:
+                    tmp=Failure.wrap(e)
+                if tmp.__class__ is Failure:
+                    if not wild:
+                        name=k
+                    elif have_plural:
+                        name=ikeys
+                    else:
+                        name=ikeys[0]
+                    name=tmp.field or name
+                    failures.setdefault(name, [])
+                    failures[name].append(tmp)
+                    if skip and not have_plural:
+                        failed.update(ikeys)
+                elif have_plural:
+                    res.update(zip(ikeys, tmp))
+                else:
+                    res[ikeys[0]]=tmp
+
+        if failures:
+            m=self._message("schema.error",
+                            "Problems were found in the submitted data.")
+            return Failure(m, failures, key='schema.error')
+        return res
@@ -0,0 +1,261 @@
+"""
+Profiles a schema over a sample corpus of records.
+
+    python -m validino.profile [options] SCHEMA CORPUS
+
+SCHEMA names the schema to profile as module:attribute, or as
+path/to/file.py:attribute; the attribute defaults to 'schema'.
+CORPUS is a file of records to validate, either JSON objects one per
+line (.jsonl) or CSV with a header row (.csv).
+
+The records are replayed through the schema twice: once with a
+FieldTimings observer to time each field, and once under cProfile to
+time each validator.  The report ranks the fields, and the validators
+by name (strip, regex, email, parse_date, ... or the name of your own
+function), by the time they took.  Allocations are not reported, as
+Python 2 has no way of tracing them.
+"""
+
+from __future__ import absolute_import
+
+import cProfile
+import csv
+import imp
+import json
+import os
+import pstats
+import re
+import sys
+from optparse import OptionParser
+
+from validino.base import Schema, Validator, _Combinator
+from validino.field import Field
+from validino.instrument import FieldTimings
+
+__all__=['load_corpus',
+         'load_schema',
+         'profile_schema',
+         'report',
+         'validator_names']
+
+
+def load_schema(spec):
+    """
+    returns the schema named by spec, either module:attribute or
+    path/to/file.py:attribute; the attribute defaults to 'schema'.
+    """
+    path, sep, attr=spec.rpartition(':')
+    if not sep or not attr or os.sep in attr:
+        path, attr=spec, 'schema'
+    if path.endswith('.py'):
+        name=os.path.splitext(os.path.basename(path))[0]
+        module=imp.load_source(name, path)
+    else:
+        module=__import__(path, {}, {}, ['__name__'])
+    try:
+        return getattr(module, attr)
+    except AttributeError:
+        raise ValueError("%s has no attribute %r" % (path, attr))
+
+
+def load_corpus(path, format=None, limit=None):
+    """
+    returns the records in a corpus file, as a list of dictionaries.
+    The format, 'jsonl' or 'csv', is guessed from the file's extension
+    if not given.
+    """
+    if format is None:
+        format=os.path.splitext(path)[1][1:].lower()
+        if format=='json':
+            format='jsonl'
+    if format not in ('jsonl', 'csv'):
+        raise ValueError("unknown corpus format: %r" % format)
+    records=[]
+    f=open(path)
+    try:
+        if format=='csv':
+            rows=csv.DictReader(f)
+        else:
+            rows=(json.loads(line) for line in f if line.strip())
+        for row in rows:
+            if limit is not None and len(records) >= limit:
+                break
+            records.append(row)
+    finally:
+        f.close()
+    return records
+
+
+def _code(func):
+    return getattr(func, '__code__', None)
+
+
+def _subclasses(cls):
+    found=[]
+    todo=[cls]
+    while todo:
+        for sub in todo.pop().__subclasses__():
+            if sub not in found:
+                found.append(sub)
+                todo.append(sub)
+    return found
+
+
+def _snake(name):
+    # ParseDate -> parse_date, after the function that makes one
+    return re.sub(r'(?<=[a-z0-9])([A-Z])', r'_\1', name).lower()
+
+
+def _functions(validator):
+    """
+    returns the plain functions used as validators, anywhere within a
+    validator, schema or field.
+    """
+    found=[]
+    seen=set()
+    todo=[validator]
+    while todo:
+        v=todo.pop()
+        if id(v) in seen:
+            continue
+        seen.add(id(v))
+        if isinstance(v, (list, tuple)):
+            todo.extend(v)
+        elif isinstance(v, Schema):
+            todo.extend(v.subvalidators.values())
+        elif isinstance(v, Field):
+            todo.append(v._validator)
+        elif isinstance(v, _Combinator):
+            todo.extend(v.validators)
+        elif _code(v) is not None:
+            found.append(v)
+    return found
+
+
+def validator_names(schema):
+    """
+    returns a dictionary mapping the code of each validator to its
+    name: Validator subclasses are named after the function that makes
+    them (Regex is 'regex'), schemas after their class, and plain
+    functions used in the schema after themselves.
+    """
+    names={}
+    for cls in _subclasses(Validator):
+        name=_snake(cls.__name__)
+        for attr in ('result', '_parse'):
+            code=_code(cls.__dict__.get(attr))
+            if code is not None:
+                names[code]=name
+    for cls in [Schema] + _subclasses(Schema):
+        code=_code(cls.__dict__.get('result'))
+        if code is not None:
+            names[code]=cls.__name__
+    for func in _functions(schema):
+        code=_code(func)
+        name=func.__name__
+        if name=='<lambda>':
+            name='lambda %s:%d' % (os.path.basename(code.co_filename),
+                                   code.co_firstlineno)
+        names.setdefault(code, name)
+    return names
+
+
+def profile_schema(schema, records):
+    """
+    replays records through schema and returns a dictionary with the
+    histograms of the time taken by each field ('fields') and the
+    calls, own and cumulative seconds of each named validator
+    ('validators').
+    """
+    names=validator_names(schema)
+
+    timings=FieldTimings()
+    schema.add_observer(timings)
+    try:
+        for data in records:
+            schema.result(data)
+    finally:
+        schema.remove_observer(timings)
+
+    prof=cProfile.Profile()
+    prof.enable()
+    try:
+        for data in records:
+            schema.result(data)
+    finally:
+        prof.disable()
+    bykey={}
+    for code, name in names.iteritems():
+        bykey[(code.co_filename, code.co_firstlineno, code.co_name)]=name
+    validators={}
+    for key, (cc, nc, tt, ct, callers) in pstats.Stats(prof).stats.iteritems():
+        name=bykey.get(key)
+        if name is None:
+            continue
+        calls, own, cumulative=validators.get(name, (0, 0.0, 0.0))
+        validators[name]=(calls + nc, own + tt, cumulative + ct)
+
+    return dict(records=len(records),
+                fields=timings.histograms(),
+                validators=validators)
+
+
+def _label(key):
+    if isinstance(key, (list, tuple)):
+        return ','.join(['%s' % k for k in key])
+    return '%s' % key
+
+
+def report(results, limit=20):
+    """
+    formats the results of profile_schema() as two tables, fields and
+    validators, each ranked by total time.
+    """
+    lines=['%d records' % results['records'],
+           '',
+           "%-30s %9s %9s %10s %10s %10s" % ('field', 'calls', 'failures',
+                                             'total ms', 'mean us',
+                                             'p99 us')]
+    rows=sorted(results['fields'].iteritems(),
+                key=lambda x: x[1].total,
+                reverse=True)
+    for key, h in rows[:limit]:
+        lines.append("%-30s %9d %9d %10.2f %10.1f %10.1f" % (
+            _label(key), h.count, h.failures, h.total * 1e3,
+            h.mean() * 1e6, h.percentile(0.99) * 1e6))
+    lines.extend(['',
+                  "%-30s %9s %10s %10s %10s" % ('validator', 'calls',
+                                                'own ms', 'cum ms',
+                                                'mean us')])
+    rows=sorted(results['validators'].iteritems(),
+                key=lambda x: x[1][1],
+                reverse=True)
+    for name, (calls, own, cumulative) in rows[:limit]:
+        lines.append("%-30s %9d %10.2f %10.2f %10.1f" % (
+            name, calls, own * 1e3, cumulative * 1e3,
+            cumulative / max(calls, 1) * 1e6))
+    return '\n'.join(lines)
+
+
+def main(args=None):
+    parser=OptionParser(usage="python -m validino.profile [options] "
+                              "SCHEMA CORPUS")
+    parser.add_option('-f', '--format', choices=['jsonl', 'csv'],
+                      help="corpus format, jsonl or csv (default: from "
+                           "the file extension)")
+    parser.add_option('-n', '--records', type='int',
+                      help="validate only the first N records")
+    parser.add_option('-l', '--limit', type='int', default=20,
+                      help="rows to show in each table [%default]")
+    options, args=parser.parse_args(args)
+    if len(args)!=2:
+        parser.error("a schema and a corpus are required")
+    sys.path.insert(0, os.getcwd())
+    schema=load_schema(args[0])
+    records=load_corpus(args[1], options.format, options.records)
+    print report(profile_schema(schema, records), options.limit)
+    return 0
+
+
+if __name__=='__main__':
+    sys.exit(main())
@@ -0,0 +1,155 @@
+"""
+Pluggable DNS resolvers, used by the email validator to check that
+an address's domain exists.
+
+A resolver's resolve() method returns the mail exchangers for a
+domain, or failing those its addresses; an empty list means there is
+no such domain.  It raises ResolverError if no answer could be had.
+
+PyDNSResolver does real lookups with pyDNS; StubResolver answers from
+a dictionary, for tests; CachingResolver wraps either, remembering
+answers (including negative ones) for a while.  resolve_many() looks
+up a batch of domains with several lookups in flight at once.
+"""
+
+import socket
+import time
+from threading import Lock
+
+try:
+    import DNS
+except ImportError:
+    DNS=None
+
+from validino.util import DefaultInstance, LRUCache, thread_map
+
+__all__=['CachingResolver',
+         'PyDNSResolver',
+         'Resolver',
+         'ResolverError',
+         'StubResolver',
+         'get_default_resolver',
+         'set_default_resolver']
+
+
+class ResolverError(Exception):
+    pass
+
+
+class Resolver(object):
+
+    def resolve(self, domain):
+        raise NotImplementedError
+
+    def resolve_many(self, domains, concurrency=10):
+        """
+        resolves each of the given domains, running up to concurrency
+        lookups at once in threads, and returns a dictionary mapping
+        each domain to its answer, or to the ResolverError raised for
+        it.
+        """
+        def lookup(domain):
+            try:
+                return domain, self.resolve(domain)
+            except ResolverError, e:
+                return domain, e
+        return dict(thread_map(lookup, set(domains), concurrency))
+
+
+class PyDNSResolver(Resolver):
+    """
+    looks domains up with pyDNS, giving up after timeout seconds.
+    The name servers are discovered on first use, not at import.
+    """
+    _discovered=False
+    _discover_lock=Lock()
+
+    def __init__(self, timeout=5):
+        if DNS is None:
+            raise RuntimeError, "pyDNS not installed, cannot check DNS"
+        self.timeout=timeout
+
+    def _discover(self):
+        self._discover_lock.acquire()
+        try:
+            if not PyDNSResolver._discovered:
+                DNS.DiscoverNameServers()
+                PyDNSResolver._discovered=True
+        finally:
+            self._discover_lock.release()
+
+    def resolve(self, domain):
+        if not self._discovered:
+            self._discover()
+        try:
+            a=DNS.DnsRequest(domain, qtype='mx', timeout=self.timeout).req().answers
+            if not a:
+                a=DNS.DnsRequest(domain, qtype='a', timeout=self.timeout).req().answers
+        except (socket.error, DNS.DNSError), e:
+            raise ResolverError(str(e))
+        return [x['data'] for x in a]
+
+
+class StubResolver(Resolver):
+    """
+    answers from a dictionary mapping domains to lists of answers;
+    unknown domains don't exist.  An exception in place of a list is
+    raised, so that failures can be simulated too.  Lookups are
+    counted in the calls attribute.
+    """
+    def __init__(self, answers=None):
+        self.answers=answers or {}
+        self.calls=0
+
+    def resolve(self, domain):
+        self.calls+=1
+        a=self.answers.get(domain, [])
+        if isinstance(a, Exception):
+            raise a
+        return list(a)
+
+
+class CachingResolver(Resolver):
+    """
+    remembers the answers of another resolver: answers for ttl
+    seconds, and the absence of a domain for negative_ttl seconds.
+    Failed lookups are not remembered.  At most maxsize domains are
+    kept, the least recently used being dropped first.
+    """
+    def __init__(self, resolver, ttl=300, negative_ttl=60, maxsize=10000):
+        self.resolver=resolver
+        self.ttl=ttl
+        self.negative_ttl=negative_ttl
+        self._cache=LRUCache(maxsize)
+
+    def _lookup(self, domain):
+        answers=self.resolver.resolve(domain)
+        if answers:
+            ttl=self.ttl
+        else:
+            ttl=self.negative_ttl
+        return time.time() + ttl, answers
+
+    def resolve(self, domain):
+        answers=self._cache.lookup_expiring(domain.lower(), self._lookup)
+        return list(answers)
+
+    def info(self):
+        return self._cache.info()
+
+    def clear(self):
+        self._cache.clear()
+
+
+_default_resolver=DefaultInstance(lambda: CachingResolver(PyDNSResolver()))
+
+def get_default_resolver():
+    """
+    returns the resolver used by email validators that weren't given
+    one: unless another has been set, a CachingResolver around a
+    PyDNSResolver, created on first use.
+    """
+    return _default_resolver.get()
+
+def set_default_resolver(resolver):
+    _default_resolver.set(resolver)
@@ -98,6 +98,21 @@ def test_dict_nest():
     assert d1['frogs']['oswald']=={'size' : 'medium'}
     d2=V.dict_unnest(d1)
     assert d==d2
+    assert sorted(V.iter_unnest(d1))==sorted(d.items())
+    deep={'a' : {'b' : {'c' : {'d' : 1}, 'e' : {}}, 'f' : 2}, 3 : 4}
+    assert V.dict_unnest(deep)=={'a.b.c.d' : 1, 'a.f' : 2, 3 : 4}
+    assert V.dict_nest({'a/b/c' : 1, 'a/b/d' : 2}, '/')=={'a' : {'b' : {'c' : 1,
+                                                                     'd' : 2}}}
+    # a subtree replaced by a value can't be written into any more
+    from collections import OrderedDict
+    for k in ('a', 'a.b'):
+        d=OrderedDict([('a.b.c', 1), (k, 2), ('a.b.d', 3)])
+        try:
+            V.dict_nest(d)
+        except (AttributeError, TypeError):
+            pass
+        else:
+            assert False, "there should be an error"
 
 def test_either():
     msg="please enter an integer"
@@ -376,3 +391,228 @@ def test_unpack_3():
             assert len(v)==1
                 
                             
+
+def test_schema_plan():
+    calls=[]
+    def record(name):
+        def f(value):
+            calls.append(name)
+            return value
+        return f
+    s=V.Schema({('a', 'b') : record('ab'),
+                'b' : (record('b'), V.integer()),
+                'a' : record('a')})
+    assert s(dict(a=1, b='2'))==dict(a=1, b=2)
+    assert calls==['a', 'b', 'ab']
+    s.subvalidators=dict(c=V.default(3))
+    assert s({})==dict(c=3)
+    # the subvalidators can't change behind the schema's back
+    validators=dict(a=V.integer())
+    s=V.Schema(validators)
+    validators['b']=V.integer()
+    assert s(dict(a='1', b='x'))==dict(a=1)
+    try:
+        s.subvalidators['b']=V.integer()
+    except TypeError:
+        pass
+    else:
+        assert False, "subvalidators should be read-only"
+    assert s.subvalidators==dict(a=V.integer())
+
+def test_schema_graph():
+    validators={'email' : V.email(),
+                'confirm' : V.strip,
+                'age' : V.integer(),
+                ('email', 'confirm') : V.fields_equal(),
+                ('age', 'email') : V.fields_match(r'(.*)', r'(.*)')}
+    s=V.Schema(validators)
+    assert s.graph()=={'age' : frozenset(),
+                       'confirm' : frozenset(),
+                       'email' : frozenset(),
+                       ('age', 'email') : frozenset(['age', 'email']),
+                       ('email', 'confirm') : frozenset(['email', 'confirm',
+                                                         ('age', 'email')])}
+    assert s.levels()==[['age', 'confirm', 'email'],
+                        [('age', 'email')],
+                        [('email', 'confirm')]]
+    del validators[('age', 'email')]
+    s.subvalidators=validators
+    assert s.levels()==[['age', 'confirm', 'email'], [('email', 'confirm')]]
+    s.subvalidators={('a', 'b') : V.fields_equal(), ('b', 'c') : V.fields_equal()}
+    assert s.levels()==[[('a', 'b')], [('b', 'c')]]
+
+def test_schema_skip_failed():
+    validators={'email' : V.email(),
+                'confirm' : V.strip,
+                ('email', 'confirm') : V.fields_equal()}
+    data=dict(email='nobody', confirm='somebody')
+    errors=V.Schema(validators).result(data).unpack_errors()
+    assert set(errors)==set([None, 'email', ('email', 'confirm')])
+    s=V.Schema(validators, skip_failed=True)
+    errors=s.result(data).unpack_errors()
+    assert set(errors)==set([None, 'email'])
+    data['email']='joe@example.com'
+    errors=s.result(data).unpack_errors()
+    assert set(errors)==set([None, ('email', 'confirm')])
+    # a failed cross-field check doesn't fail the fields it checks
+    s=V.Schema({'a' : V.integer(), 'b' : V.integer(), 'c' : V.integer(),
+                ('a', 'b') : V.fields_equal('ab'),
+                ('b', 'c') : V.fields_equal('bc')},
+               skip_failed=True)
+    errors=s.result(dict(a='1', b='2', c='3')).unpack_errors()
+    assert errors[('a', 'b')]==['ab']
+    assert errors[('b', 'c')]==['bc']
+    errors=s.result(dict(a='1', b='x', c='3')).unpack_errors()
+    assert set(errors)==set([None, 'b'])
+
+def test_schema_validate_many():
+    s=V.Schema(dict(x=V.integer('intx')), 'schema')
+    records=(dict(x=str(i)) if i % 3 else dict(x='bad') for i in xrange(7))
+    res=list(s.validate_many(records))
+    assert [r[0] for r in res]==range(7)
+    assert res[1]==(1, dict(x=1), None)
+    assert res[3]==(3, None, {None : ['schema'], 'x' : ['intx']})
+    chunks=list(s.validate_many([dict(x='1')]*5, chunksize=2))
+    assert [len(c) for c in chunks]==[2, 2, 1]
+    assert chunks[2]==[(4, dict(x=1), None)]
+
+def test_schema_validate_parallel():
+    s=V.Schema(dict(x=(V.integer('intx'), V.clamp(min=0, msg='clampx'))),
+               'schema')
+    records=[dict(x=str(i - 5)) for i in range(50)]
+    res=list(s.validate_parallel(iter(records), workers=2, chunksize=7))
+    assert [r[0] for r in res]==range(50)
+    for i, converted, errors in res:
+        if i < 5:
+            assert converted is None
+            assert errors=={None : ['schema'], 'x' : ['clampx']}
+        else:
+            assert converted==dict(x=i - 5)
+            assert errors is None
+    # workers are only started on iteration, and stopped when it's
+    # abandoned
+    import multiprocessing
+    it=s.validate_parallel(iter(records), workers=2, chunksize=7)
+    assert not multiprocessing.active_children()
+    for i, converted, errors in it:
+        break
+    assert i==0
+    assert multiprocessing.active_children()
+    it.close()
+    assert not multiprocessing.active_children()
+
+def test_pickle():
+    import pickle
+    v=V.compose(V.strip,
+                V.either(V.empty(),
+                         V.compose(V.integer('int'),
+                                   V.clamp(min=3, max=7, msg='clamp'))))
+    for proto in range(pickle.HIGHEST_PROTOCOL + 1):
+        v2=pickle.loads(pickle.dumps(v, proto))
+        assert v2==v
+        assert hash(v2)==hash(v)
+        assert v2(' 5 ')==5
+        assert_invalid(lambda: v2('9'), 'clamp')
+    assert V.clamp(min=3)!=V.clamp(min=4)
+    assert V.belongs(['a', 'b'])==V.belongs(['a', 'b'])
+    s=V.Schema(dict(x=(V.integer(), V.clamp(max=3)),
+                    y=V.parse_date('%Y-%m-%d')),
+               'schema')
+    s2=pickle.loads(pickle.dumps(s))
+    assert s2(dict(x='2', y='2007-07-02'))==s(dict(x='2', y='2007-07-02'))
+    assert V.clamp(min=3, max=5).min==3
+
+def test_result():
+    v=V.either(V.empty(),
+               V.compose(V.integer('int'), V.clamp(max=10, msg='clamp')))
+    assert v.result('')==''
+    assert v.result('4')==4
+    r=v.result('40')
+    assert isinstance(r, V.Failure)
+    assert r.unpack_errors()=={None : ['clamp']}
+    assert_invalid(lambda: v('40'), 'clamp')
+
+    def plain(value):
+        raise V.Invalid('plain')
+    r=V.as_result(V.check(plain))(3)
+    assert isinstance(r, V.Failure)
+    assert r.exception().message=='plain'
+
+    s=V.Schema(dict(x=(V.integer('intx'), V.clamp(min=5, msg='clampx')),
+                    y=plain,
+                    z=V.default(3)),
+               'schema')
+    r=s.result(dict(x='1', y=2))
+    assert isinstance(r, V.Failure)
+    assert r.unpack_errors()=={None : ['schema'],
+                               'x' : ['clampx'],
+                               'y' : ['plain']}
+    assert s.result(dict(x='1', y=2)).__class__ is V.Failure
+    outer=V.Schema(dict(inner=s), 'outer')
+    assert_invalid(lambda: outer(dict(inner=dict(x='7'))), 'outer')
+
+def test_regex_compiled():
+    import re
+    v=V.regex(re.compile('shrub', re.I), 'regex')
+    assert v('SHRUBbery')=='SHRUBbery'
+    assert_invalid(lambda: v('a shrubbery'), 'regex')
+    before=V.pattern_cache_info()
+    V.regex('pattern-for-cache-test')
+    V.regex_sub('pattern-for-cache-test', '')
+    after=V.pattern_cache_info()
+    assert after['hits']>=before['hits'] + 1
+    assert after['size']<=after['maxsize']
+
+def test_lru_cache():
+    from validino.util import LRUCache
+    c=LRUCache(2)
+    c.lookup('a', str.upper)
+    c.lookup('b', str.upper)
+    assert c.lookup('a', None)=='A'
+    c.lookup('c', str.upper)
+    assert len(c)==2
+    assert c.lookup('a', None)=='A'
+    assert c.info()==dict(hits=2, misses=3, size=2, maxsize=2)
+
+def test_time_format():
+    import datetime
+    import time
+    from validino.timeformat import compile_format
+    for fmt, values in (('%Y-%m-%dT%H:%M:%S', ('2007-03-04T12:30:59',
+                                                '2007-3-4T1:2:3',
+                                                '2007-02-30T00:00:00',
+                                                '2007-03-04T12:30')),
+                        ('%m/%d/%Y', ('03/04/2007', '3/4/2007',
+                                      ' 3/ 4/2007', '13/04/2007')),
+                        ('%d %b %y', ('4 Mar 07', '4 mar 70')),
+                        ('%y%m%d %%', ('070304 %', '700304  %'))):
+        p=compile_format(fmt)
+        assert compile_format(fmt) is p
+        for value in values:
+            try:
+                expected=time.strptime(value, fmt)
+            except ValueError:
+                expected=None
+            try:
+                res=p.parse(value)
+            except ValueError:
+                res=None
+            assert res==expected, (fmt, value, res, expected)
+    v=V.parse_datetime('%Y-%m-%d %H:%M:%S', 'bad')
+    assert v('2007-03-04 12:30:05')==datetime.datetime(2007, 3, 4, 12, 30, 5)
+    assert_invalid(lambda: v('2007-03-04 12:30:61'), 'bad')
+
+def test_overridden_call():
+    class Upper(V.Field):
+        def __call__(self, data):
+            return V.Field.__call__(self, data).upper()
+    class Doubled(V.Validator):
+        def __call__(self, value):
+            return value * 2
+    f=Upper(V.strip, V.not_empty('empty'))
+    s=V.Schema(dict(name=f, n=Doubled()))
+    assert s(dict(name=' joe ', n=2))==dict(name='JOE', n=4)
+    assert f.result(' joe ')=='JOE'
+    errors=s.result(dict(name=' ', n=1)).unpack_errors()
+    assert errors['name']==['empty']
+    assert V.as_result(V.Field(V.strip)).__name__=='result'
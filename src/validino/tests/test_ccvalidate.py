@@ -0,0 +1,59 @@
+import validino.ccvalidate as cc
+
+def test_prefix_for_ccnum():
+    assert cc.prefix_for_ccnum('4000000000998')=='4'
+    assert cc.prefix_for_ccnum('3001234')=='300'
+    assert cc.prefix_for_ccnum('3612345')=='36'
+    assert cc.prefix_for_ccnum('3912345')=='3'
+    assert cc.prefix_for_ccnum('6011000000000000')=='6011'
+    assert cc.prefix_for_ccnum('9999') is None
+
+def test_luhn():
+    assert cc.luhn_checksum('4000000000998')==0
+    assert cc.luhn_checksum('4000000000997')!=0
+    assert cc.luhn_check_digit('400000000099')=='8'
+    assert cc.luhn_check_digit('7992739871')=='3'
+
+def test_check_credit_card():
+    cc.check_credit_card('4000-0000-0099 8')
+    cc.check_credit_card('4000000000998', cc.VISA)
+    for num, exc in (('4000000000997', cc.CreditCardFormatException),
+                     ('40000000009980', cc.CreditCardFormatException),
+                     ('9000000000998', cc.UnknownCreditCardPrefixException),
+                     ('4x00000000998', cc.CreditCardValidationException)):
+        try:
+            cc.check_credit_card(num)
+        except exc:
+            pass
+        else:
+            assert False, "expected %s for %s" % (exc.__name__, num)
+    try:
+        cc.check_credit_card('4000000000998', cc.AMEX)
+    except cc.BadCreditCardTypeException:
+        pass
+    else:
+        assert False, "expected BadCreditCardTypeException"
+    # En Route numbers have no check digit
+    cc.check_credit_card('201400000000001')
+
+def test_generate_cards():
+    nums=list(cc.generate_cards(cc.VISA, count=25))
+    assert len(nums)==25
+    assert nums==sorted(nums)
+    assert nums[0]=='4000000000006'
+    for n in nums:
+        cc.check_credit_card(n, cc.VISA)
+    nums=list(cc.generate_cards(cc.AMEX, prefix='37', start='370000000009999',
+                                count=3))
+    assert nums[0]>='370000000009999'
+    assert [len(n) for n in nums]==[15, 15, 15]
+    for n in nums:
+        cc.check_credit_card(n, cc.AMEX)
+    for n in cc.generate_cards(cc.MASTERCARD, count=50, valid=False):
+        try:
+            cc.check_credit_card(n)
+        except cc.CreditCardFormatException:
+            pass
+        else:
+            assert False, "%s should be invalid" % n
+    assert cc._gen_fake(cc.VISA, num=2)==['4000000000006', '4000000000014']
@@ -0,0 +1,124 @@
+from unittest import SkipTest
+
+from validino import columnar as C
+from validino.util import partial
+
+try:
+    import numpy
+except ImportError:
+    numpy=None
+
+def setup_module():
+    if numpy is None:
+        raise SkipTest("numpy not installed")
+
+def test_integer():
+    values, valid, errors=C.integer(['1', ' 2 ', 'x', '-4', None])
+    assert list(valid)==[True, True, False, True, False]
+    assert list(values[valid])==[1, 2, -4]
+    assert list(errors)==[None, None, 'integer', None, 'integer']
+    values, valid, errors=C.integer(numpy.array([1.5, numpy.nan, 3]))
+    assert list(valid)==[True, False, True]
+    assert list(values[valid])==[1, 3]
+    # too big for an int64, so kept as longs rather than wrapped
+    values, valid, errors=C.integer(numpy.array([1e19, -1e19, 2.0]))
+    assert list(valid)==[True, True, True]
+    assert list(values)==[10 ** 19, -10 ** 19, 2]
+    values, valid, errors=C.integer(numpy.array([2 ** 64 - 1, 1],
+                                                dtype=numpy.uint64))
+    assert list(values)==[2 ** 64 - 1, 1]
+
+def test_clamp():
+    values, valid, errors=C.clamp(numpy.arange(6), min=1, max=4)
+    assert list(valid)==[False, True, True, True, True, False]
+    assert list(errors)==['min', None, None, None, None, 'max']
+
+def test_clamp_length():
+    data=['a', 'abc', 'abcdef']
+    for column in (data, numpy.array(data, dtype=object)):
+        values, valid, errors=C.clamp_length(column, min=2, max=4)
+        assert list(errors)==['minlen', None, 'maxlen']
+
+def test_belongs():
+    values, valid, errors=C.belongs(['fish', 'frog', 'dog'],
+                                    ('fish', 'dog'))
+    assert list(valid)==[True, False, True]
+    assert list(errors)==[None, 'belongs', None]
+
+def test_compose():
+    values, valid, errors=C.compose(['4', 'x', '200', '-1'],
+                                    C.integer,
+                                    partial(C.clamp, min=0, max=130),
+                                    partial(C.belongs, domain=range(10)))
+    assert list(valid)==[True, False, False, False]
+    assert list(errors)==[None, 'integer', 'max', 'min']
+    assert values[0]==4
+    messages=C.error_messages(errors, dict(integer='int'))
+    assert list(messages)==[None, 'int', 'max', 'min']
+    messages=C.error_messages(errors)
+    assert messages[1]=='not an integer'
+
+def test_check_credit_cards():
+    import validino.ccvalidate as cc
+    numbers=['4000000000998', '4000-0000-0099 8', '4000000000997',
+             '40000000009980', '9000000000998', '4x00000000998',
+             '201400000000001', '', '378282246310005', u'6011111111111117']
+    types, length_ok, luhn_ok=cc.check_credit_cards(numbers)
+    for i, num in enumerate(numbers):
+        try:
+            cc.check_credit_card(num)
+        except cc.CreditCardValidationException:
+            expected=False
+        else:
+            expected=True
+        assert (types[i] is not None and length_ok[i] and luhn_ok[i])==expected
+    assert list(types[[0, 4, 5, 6, 8]])==[cc.VISA, None, None,
+                                          cc.EN_ROUTE, cc.AMEX]
+    assert list(length_ok[:4])==[True, True, True, False]
+    assert list(luhn_ok[:3])==[True, True, False]
+
+def test_credit_card_column():
+    import validino as V
+    v=V.credit_card(require_type=True)
+    values, valid, errors=v.validate_column(
+        ['4000000000998', '4000000000997', '4000000000998',
+         '4000000000998', '4000000000998'],
+        ['Visa', 'Visa', 'Amex', None, 'Discover'])
+    assert list(valid)==[True, False, False, False, False]
+    assert list(errors)==[None,
+                          'credit_card.invalid',
+                          'credit_card.type_check',
+                          'credit_card.require_type',
+                          'credit_card.invalid']
+
+def test_parse_date():
+    data=['2007-03-04', '2007-3-4', '2007-02-30', 'x', '1900-02-29',
+          '0000-01-01', '2008-02-29']
+    values, valid, errors=C.parse_date(data, '%Y-%m-%d')
+    assert values.dtype==numpy.dtype('datetime64[D]')
+    assert list(valid)==[True, True, False, False, False, False, True]
+    assert list(errors[~valid])==['parse_time'] * 4
+    assert str(values[0])=='2007-03-04'
+    assert str(values[1])=='2007-03-04'
+    assert str(values[6])=='2008-02-29'
+    assert numpy.isnat(values[2])
+    values, valid, errors=C.parse_date(['03/04/07', '03/04/70', ''],
+                                       '%m/%d/%y',
+                                       valid=[True, True, False])
+    assert list(values[:2].astype(str))==['2007-03-04', '1970-03-04']
+    assert list(valid)==[True, True, False]
+    values, valid, errors=C.parse_date(['2007-03-04', None, numpy.nan],
+                                       '%Y-%m-%d')
+    assert list(valid)==[True, False, False]
+    assert list(errors)==[None, 'parse_time', 'parse_time']
+
+def test_parse_datetime():
+    data=['03/04/2007 12:30', '3/4/2007 1:05', '03/04/2007 24:00',
+          '03/04/2007 12:30 ']
+    values, valid, errors=C.parse_datetime(data, '%m/%d/%Y %H:%M')
+    assert list(valid)==[True, True, False, False]
+    assert str(values[0])=='2007-03-04T12:30:00'
+    assert str(values[1])=='2007-03-04T01:05:00'
+    values, valid, errors=C.parse_datetime(['2007-03-04 12:30:61'],
+                                           '%Y-%m-%d %H:%M:%S')
+    assert list(errors)==['parse_time']
@@ -87,3 +87,134 @@ def test_url():
     assert v(u)==u
     v=V.url(True)
     assert v(u)==u
+
+def test_pickle():
+    import pickle
+    for v in (V.email(msg='snog'),
+              V.credit_card(require_type=True),
+              V.url(schemas=('http',)),
+              V.Field(V.integer(), required=True),
+              V.DateField()):
+        v2=pickle.loads(pickle.dumps(v, 2))
+        if isinstance(v, V.Validator):
+            assert v2==v
+
+def test_ip_strict():
+    v=V.ip('donkey')
+    for bad in ('1.2.3', '1.2.3.4.5', '256.1.1.1', '01.2.3.4', '1.2.3.4\n',
+                '1abc', None):
+        assert_invalid(lambda: v(bad), 'donkey')
+    assert v('0.0.0.0')=='0.0.0.0'
+
+def test_ipv6():
+    v=V.ipv6('six')
+    for good in ('::', '::1', '2001:db8::8a2e:370:7334',
+                 '2001:0db8:0000:0000:0000:ff00:0042:8329',
+                 '::ffff:192.0.2.128', 'fe80::'):
+        assert v(good)==good
+    for bad in ('1::2::3', '12345::', '1:2:3:4:5:6:7:8:9', '1.2.3.4::',
+                ':1::', '1:2:3:4:5:6:7::8', 'g::'):
+        assert_invalid(lambda: v(bad), 'six')
+
+def test_ip_network():
+    v=V.ip_network('net')
+    assert v('10.0.0.0/8')=='10.0.0.0/8'
+    assert v('2001:db8::/32')=='2001:db8::/32'
+    assert v('1.2.3.4')=='1.2.3.4'
+    for bad in ('10.0.0.1/8', '10.0.0.0/33', '10.0.0.0/', '10.0.0.0/x'):
+        assert_invalid(lambda: v(bad), 'net')
+
+def test_ip_in():
+    networks=['10.0.0.0/8', '192.168.1.0/24', '203.0.113.7', '2001:db8::/32']
+    v=V.ip_in(networks, msg=dict(ip='bad', ip_in='out'))
+    for good in ('10.200.3.4', '192.168.1.255', '203.0.113.7', '2001:db8::1'):
+        assert v(good)==good
+    for out in ('11.0.0.1', '192.168.2.1', '203.0.113.8', '2001:db9::1'):
+        assert_invalid(lambda: v(out), 'out')
+    assert_invalid(lambda: v('nope'), 'bad')
+    v=V.ip_not_in(networks, 'blocked')
+    assert v('11.0.0.1')=='11.0.0.1'
+    assert_invalid(lambda: v('10.1.1.1'), 'blocked')
+    many=V.ip_in(['10.%d.%d.0/24' % (i, j)
+                  for i in range(100) for j in range(100)])
+    assert many('10.99.42.7')=='10.99.42.7'
+
+def test_email_resolver():
+    from validino.resolver import (CachingResolver, ResolverError,
+                                   StubResolver)
+    stub=StubResolver({'example.com' : ['mx.example.com'],
+                       'broken.com' : ResolverError('timeout')})
+    resolver=CachingResolver(stub)
+    v=V.email(True,
+              {'email.domain_error' : 'nodomain',
+               'email.socket_error' : 'socket'},
+              resolver)
+    for i in range(3):
+        assert v('joe@example.com')=='joe@example.com'
+        assert v('joe@EXAMPLE.com')=='joe@EXAMPLE.com'
+        assert_invalid(lambda: v('joe@nowhere.com'), 'nodomain')
+        assert_invalid(lambda: v('joe@broken.com'), 'socket')
+    # answers, positive and negative, are cached; failures are not
+    assert stub.calls==5
+    res=resolver.resolve_many(['example.com', 'broken.com', 'other.com'])
+    assert res['example.com']==['mx.example.com']
+    assert res['other.com']==[]
+    assert isinstance(res['broken.com'], ResolverError)
+    # expired answers are looked up again
+    resolver=CachingResolver(stub, ttl=-1)
+    calls=stub.calls
+    resolver.resolve('example.com')
+    resolver.resolve('example.com')
+    assert stub.calls==calls + 3
+
+def _serve_statuses():
+    import threading
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version='HTTP/1.1'
+        requests=[]
+        def do_HEAD(self):
+            self.requests.append(self.path)
+            if self.path.startswith('/ok'):
+                self.send_response(200)
+            else:
+                self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        def log_message(self, *args):
+            pass
+    class Server(ThreadingMixIn, HTTPServer):
+        daemon_threads=True
+    server=Server(('127.0.0.1', 0), Handler)
+    t=threading.Thread(target=server.serve_forever)
+    t.setDaemon(True)
+    t.start()
+    return server, Handler.requests
+
+def test_url_checker():
+    from validino.urlcheck import UrlChecker, UrlCheckError
+    server, requests=_serve_statuses()
+    try:
+        base='http://127.0.0.1:%d' % server.server_address[1]
+        checker=UrlChecker(connect_timeout=2, read_timeout=2)
+        v=V.url(True, msg={'url.not_exists' : 'missing'}, checker=checker)
+        for i in range(3):
+            assert v(base + '/ok')==base + '/ok'
+            assert_invalid(lambda: v(base + '/gone'), 'missing')
+        # one connection, kept alive; statuses are cached
+        assert checker.connections_made==1
+        assert requests==['/ok', '/gone']
+        urls=[base + '/ok%d' % i for i in range(20)]
+        res=checker.check_many(urls + [base + '/gone'], concurrency=4)
+        assert len(requests)==22
+        assert res[base + '/gone']==404
+        assert all(res[u]==200 for u in urls)
+        assert checker.connections_made <= 5
+        checker.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+    checker=UrlChecker(connect_timeout=1)
+    res=checker.check_many([base + '/ok'])
+    assert isinstance(res[base + '/ok'], UrlCheckError)
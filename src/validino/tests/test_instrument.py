@@ -0,0 +1,52 @@
+import validino as V
+from validino.instrument import FieldTimings, Histogram
+
+def test_histogram():
+    h=Histogram((0.001, 0.01, 0.1))
+    for t in (0.0005, 0.002, 0.003, 0.05, 2.0):
+        h.add(t)
+    h.add(0.004, False)
+    assert h.counts==[1, 3, 1, 1]
+    assert h.count==6
+    assert h.failures==1
+    assert h.percentile(0.5)==0.01
+    assert h.percentile(1)==2.0
+
+def test_schema_observers():
+    seen=[]
+    def observer(schema, key, seconds, ok, message_key):
+        seen.append((key, ok, message_key))
+        assert seconds >= 0
+    s=V.Schema({'age' : (V.integer(), V.clamp(max=130)),
+                'email' : V.email(),
+                'confirm' : V.not_empty(),
+                ('email', 'confirm') : V.fields_equal()})
+    data=dict(age='200', email='joe@example.com', confirm='bob@example.com')
+    s.add_observer(observer)
+    timings=FieldTimings()
+    V.add_observer(timings)
+    try:
+        errors=s.result(data).unpack_errors()
+    finally:
+        V.remove_observer(timings)
+    assert set(errors)==set([None, 'age', ('email', 'confirm')])
+    assert set(seen)==set([('age', False, 'max'),
+                           ('confirm', True, None),
+                           ('email', True, None),
+                           (('email', 'confirm'), False, 'fields_equal')])
+    assert timings['age'].failures==1
+    assert timings[('email', 'confirm')].count==1
+    assert 'fields_equal' not in timings.report()
+    assert len(timings.report().splitlines())==5
+    s.remove_observer(observer)
+    s(dict(age='20', email='a@example.com', confirm='a@example.com'))
+    assert len(seen)==4
+    assert timings['age'].count==1
+
+def test_failing_observer():
+    def observer(schema, key, seconds, ok, message_key):
+        raise RuntimeError("broken observer")
+    s=V.Schema(dict(a=V.integer(), b=V.strip))
+    s.add_observer(observer)
+    assert s(dict(a='1', b=' x '))==dict(a=1, b='x')
+    assert set(s.result(dict(a='x', b='')).unpack_errors())==set([None, 'a'])
@@ -12,3 +12,25 @@ def test_msg():
         assert_invalid(lambda: V.integer()('lump'), messages['integer'])
     assert getMessages() != messages
     assert_invalid(lambda: V.integer()('lump'), "not an integer")
+
+def test_msg_cached():
+    v=V.integer()
+    assert_invalid(lambda: v('lump'), "not an integer")
+    with msg(dict(integer="number, please")):
+        assert_invalid(lambda: v('lump'), "number, please")
+        assert_invalid(lambda: v('lump'), "number, please")
+    assert_invalid(lambda: v('lump'), "not an integer")
+    v=V.integer(msg=dict(integer='mine'))
+    with msg(dict(integer="number, please")):
+        assert_invalid(lambda: v('lump'), "mine")
+
+def test_msg_thread():
+    import threading
+    res=[]
+    def f():
+        res.append(getMessages().get('integer'))
+    with msg(dict(integer="number, please")):
+        t=threading.Thread(target=f)
+        t.start()
+        t.join()
+    assert res==['not an integer']
@@ -0,0 +1,60 @@
+import threading
+
+import validino as V
+from validino import metrics
+
+def test_metrics():
+    s=V.Schema({'age' : V.integer(),
+                'name' : V.not_empty(),
+                'email' : V.email(),
+                'confirm' : V.not_empty(),
+                ('email', 'confirm') : V.fields_equal()})
+    data=[dict(age='1', name='joe', email='a@example.com', confirm='a@example.com'),
+          dict(age='x', name='', email='a@example.com', confirm='b@example.com')]
+    m=metrics.Metrics()
+    V.add_observer(m)
+    try:
+        def work():
+            for i in range(50):
+                for d in data:
+                    s.result(d)
+        threads=[threading.Thread(target=work) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        V.remove_observer(m)
+    counts=m.counts()
+    # the finished threads' counts have been folded into the total
+    assert m._threads==[]
+    assert counts['validations']['age']==400
+    assert counts['failures']['age']==200
+    assert counts['failures'][('email', 'confirm')]==200
+    assert 'email' not in counts['failures']
+    assert counts['message_failures']=={'integer' : 200,
+                                        'notempty' : 200,
+                                        'fields_equal' : 200}
+    text=m.render()
+    assert '# TYPE validino_failures_total counter' in text
+    assert 'validino_failures_total{field="email,confirm"} 200' in text
+    assert 'validino_message_failures_total{message_key="notempty"} 200' in text
+    V.add_observer(m)
+    try:
+        s.result(data[1])
+    finally:
+        V.remove_observer(m)
+    assert len(m._threads)==1
+    assert m.counts()['failures']['age']==201
+    m.reset()
+    assert m.counts()['validations']=={}
+
+def test_metrics_default():
+    metrics.enable()
+    metrics.enable()
+    try:
+        V.Schema(dict(a=V.integer())).result(dict(a='x'))
+    finally:
+        metrics.disable()
+    assert 'validino_failures_total{field="a"} 1' in metrics.render()
+    metrics.default_metrics.reset()
@@ -0,0 +1,89 @@
+import pickle
+
+import validino as V
+from util import assert_invalid
+
+def _check_max(value):
+    qty, max=value
+    if max is not None and qty > int(max):
+        raise V.Invalid('too many')
+    return value
+
+def _schema(**kw):
+    return V.NestedSchema({'name' : V.not_empty('name'),
+                           'address.zip' : (V.strip,
+                                            V.clamp_length(max=5, msg='zip')),
+                           'items.*.qty' : V.integer('qty'),
+                           'items.*.sku' : V.not_empty('sku'),
+                           ('items.*.qty', 'items.*.max') : _check_max},
+                          **kw)
+
+def test_nested_schema_flat():
+    s=_schema()
+    data={'name' : 'joe',
+          'address.zip' : ' 10003 ',
+          'items.0.qty' : '3',
+          'items.0.sku' : 'a',
+          'items.1.qty' : '9',
+          'items.1.sku' : 'b',
+          'items.1.max' : '5',
+          'items.2.sku' : 'c'}
+    errors=s.result(data).unpack_errors()
+    assert errors['items.2.qty']==['qty']
+    assert errors[('items.1.qty', 'items.1.max')]==['too many']
+    assert len(errors)==3
+    data['items.1.max']='10'
+    data['items.2.qty']='1'
+    res=s(data)
+    assert res['address.zip']=='10003'
+    assert res['items.1.qty']==9
+    assert res['items.2.max'] is None
+    assert len(res)==11
+
+def test_nested_schema_nested():
+    s=_schema(allow_extra=False)
+    data={'name' : 'joe',
+          'address' : {'zip' : '10003'},
+          'items' : [{'qty' : '3', 'sku' : 'a'},
+                     {'qty' : '4', 'sku' : 'b', 'max' : 4}]}
+    res=s(data)
+    assert res=={'name' : 'joe',
+                 'address.zip' : '10003',
+                 'items.0.qty' : 3,
+                 'items.0.sku' : 'a',
+                 'items.0.max' : None,
+                 'items.1.qty' : 4,
+                 'items.1.sku' : 'b',
+                 'items.1.max' : 4}
+    assert V.dict_nest(res)['items']['1']['qty']==4
+    data['items'][1]['qty']='5'
+    errors=s.result(data).unpack_errors()
+    assert errors[('items.1.qty', 'items.1.max')]==['too many']
+    data['address']['street']='Main St.'
+    assert_invalid(lambda: s(data), 'extra keys in input')
+    s2=pickle.loads(pickle.dumps(_schema(), 2))
+    assert s2({'name' : 'joe', 'address.zip' : '1', 'items.0.qty' : '1', 'items.0.sku' : 'a'})['items.0.qty']==1
+
+def test_nested_schema_extra_missing():
+    s=V.NestedSchema({'name' : V.strip, 'items.*.qty' : V.integer()},
+                     allow_extra=False, allow_missing=False)
+    assert s({'name' : 'j', 'items' : [{'qty' : '1'}]})=={'name' : 'j',
+                                                          'items.0.qty' : 1}
+    assert s({'name' : 'j', 'items' : []})=={'name' : 'j'}
+    for data in ({'name' : 'j', 'items' : [{'qty' : '1', 'bogus' : 'x'}]},
+                 {'name' : 'j', 'items.0.qty' : '1', 'items.0.bogus' : 'x'}):
+        assert_invalid(lambda: s(data), 'extra keys in input')
+    for data in ({'name' : 'j', 'items' : [{'qty' : '1'}, {}]},
+                 {'name' : 'j', 'items.0.qty' : '1', 'items.1' : {}},
+                 {'items' : []}):
+        assert_invalid(lambda: s(data), 'missing keys in input')
+
+def test_nested_schema_skip_failed():
+    s=V.NestedSchema({'items.*.qty' : V.integer('qty'),
+                      'items.*.max' : V.default('10'),
+                      ('items.*.qty', 'items.*.max') : _check_max},
+                     skip_failed=True)
+    data={'items' : [{'qty' : 'x'}, {'qty' : '11'}]}
+    errors=s.result(data).unpack_errors()
+    assert set(errors)==set([None, 'items.0.qty',
+                             ('items.1.qty', 'items.1.max')])
@@ -0,0 +1,58 @@
+import os
+import shutil
+import tempfile
+
+import validino as V
+from validino import profile
+
+_schema_source='''
+import validino as V
+
+def shout(value):
+    return value.upper()
+
+schema=V.Schema({'name' : (V.strip, V.not_empty(), shout),
+                 'born' : V.parse_date('%Y-%m-%d'),
+                 'email' : V.email(),
+                 'confirm' : V.strip,
+                 ('email', 'confirm') : V.fields_equal()})
+'''
+
+def test_names():
+    names=profile.validator_names(V.Schema(dict(a=(V.strip, V.regex('a')),
+                                                b=lambda x: x)))
+    found=set(names.values())
+    assert set(['strip', 'regex', 'parse_date', 'email', 'fields_equal',
+                'Schema', 'NestedSchema']) <= found
+    assert [n for n in found if n.startswith('lambda test_profile.py:')]
+
+def test_profile():
+    d=tempfile.mkdtemp()
+    try:
+        path=os.path.join(d, 'profiled.py')
+        f=open(path, 'w')
+        f.write(_schema_source)
+        f.close()
+        schema=profile.load_schema(path)
+        assert profile.load_schema(path + ':schema') is not schema
+        path=os.path.join(d, 'corpus.csv')
+        f=open(path, 'w')
+        f.write('name,born,email,confirm\n'
+                ' joe ,1970-01-02,joe@example.com,joe@example.com\n'
+                ',1970-02-30,nobody,somebody\n')
+        f.close()
+        records=profile.load_corpus(path)
+        assert len(records)==2
+        assert records[0]['name']==' joe '
+        results=profile.profile_schema(schema, records)
+    finally:
+        shutil.rmtree(d)
+    assert results['fields']['name'].count==2
+    assert results['fields']['born'].failures==1
+    calls, own, cumulative=results['validators']['shout']
+    assert calls==1
+    assert results['validators']['strip'][0]==4
+    assert results['validators']['parse_date'][0]==2
+    text=profile.report(results)
+    assert 'shout' in text
+    assert 'email,confirm' in text
@@ -0,0 +1,102 @@
+import pickle
+import threading
+
+import validino as V
+
+class _Rendezvous(object):
+    """
+    passes values through once n calls are waiting at once, noting
+    whether they ever were.
+    """
+    def __init__(self, n):
+        self.n=n
+        self.calls=0
+        self.lock=threading.Lock()
+        self.event=threading.Event()
+        self.met=[]
+
+    def __call__(self, value):
+        self.lock.acquire()
+        self.calls+=1
+        if self.calls >= self.n:
+            self.event.set()
+        self.lock.release()
+        self.event.wait(10)
+        self.met.append(self.event.isSet())
+        return value
+
+def _validators(slow=lambda x: x):
+    return {'email' : (V.blocking(slow), V.email()),
+            'confirm' : V.blocking(slow),
+            'name' : (V.strip, V.not_empty('name')),
+            'age' : (V.blocking(slow), V.integer('age')),
+            ('email', 'confirm') : V.fields_equal('mismatch')}
+
+def test_is_blocking():
+    assert V.is_blocking(V.blocking(V.strip))
+    assert V.is_blocking((V.strip, V.either(V.empty(), V.blocking(V.strip))))
+    assert V.is_blocking(V.Schema(dict(a=V.url(check_exists=True))))
+    assert not V.is_blocking(V.compose(V.strip, V.url(), V.email()))
+
+def test_threaded_schema():
+    slow=_Rendezvous(3)
+    s=V.ThreadedSchema(_validators(slow))
+    assert [len(level) for level in s.levels()]==[4, 1]
+    data=dict(email='joe@example.com', confirm='joe@example.com',
+              name=' joe ', age='42')
+    assert s(data)==dict(email='joe@example.com', confirm='joe@example.com',
+                         name='joe', age=42)
+    # the three slow steps waited together
+    assert slow.met==[True, True, True]
+    data.update(confirm='bob@example.com', name=' ', age='old')
+    errors=s.result(data).unpack_errors()
+    assert errors==V.Schema(_validators()).result(data).unpack_errors()
+    assert set(errors)==set([None, 'name', 'age', ('email', 'confirm')])
+    s2=pickle.loads(pickle.dumps(V.ThreadedSchema(dict(a=V.integer()),
+                                                  skip_failed=True)))
+    assert s2(dict(a='1'))==dict(a=1)
+
+def test_threaded_schema_pool():
+    # all schemas share one pool of threads
+    V.shutdown()
+    before=threading.active_count()
+    for i in range(5):
+        s=V.ThreadedSchema(_validators())
+        assert s(dict(email='joe@example.com', confirm='joe@example.com',
+                      name='joe', age='1'))['age']==1
+    assert threading.active_count() <= before + V.threaded.pool_size + 3
+    # a threaded schema within a pooled step runs in that thread
+    inner=V.ThreadedSchema(dict(a=V.blocking(V.integer())))
+    outer=V.ThreadedSchema(dict(x=V.blocking(inner), y=V.blocking(inner)))
+    assert outer(dict(x=dict(a='1'), y=dict(a='2')))==dict(x=dict(a=1),
+                                                          y=dict(a=2))
+    V.shutdown()
+
+def test_threaded_schema_skip_failed():
+    s=V.ThreadedSchema(_validators(), skip_failed=True)
+    errors=s.result(dict(email='nobody', confirm='somebody',
+                         name='joe', age='1')).unpack_errors()
+    assert set(errors)==set([None, 'email'])
+    s=V.ThreadedSchema({'a' : V.blocking(V.strip), 'b' : V.strip,
+                        'c' : V.strip,
+                        ('a', 'b') : V.fields_equal('ab'),
+                        ('b', 'c') : V.fields_equal('bc')},
+                       skip_failed=True)
+    errors=s.result(dict(a='1', b='2', c='3')).unpack_errors()
+    assert set(errors)==set([None, ('a', 'b'), ('b', 'c')])
+
+def test_concurrent_combinators():
+    slow=_Rendezvous(2)
+    v=V.concurrent_check(slow, slow, V.integer())
+    assert v('1')=='1'
+    assert slow.met==[True, True]
+    v=V.concurrent_check(V.strip, V.integer())
+    try:
+        v('x')
+    except V.Invalid:
+        pass
+    else:
+        assert False, "there should be an error"
+    v=V.concurrent_either(V.integer(), V.compose(V.strip, V.not_empty()))
+    assert v(' x ')=='x'
+    assert v('2')==2
@@ -0,0 +1,307 @@
+"""
+Schemas that run blocking validators concurrently, on threads.
+
+Validators that do I/O -- email() with check_dns, url() with
+check_exists, or lookups of your own marked with blocking() -- spend
+most of their time waiting.  ThreadedSchema runs the steps that
+contain them on a pool of worker threads, so that independent ones
+wait at the same time, and runs everything else in the calling thread
+as Schema does:
+
+>>> import validino as V
+>>> def unique(username):
+...     # a database query, say
+...     return username
+>>> s=V.ThreadedSchema(dict(username=(V.strip, V.blocking(unique)),
+...                         homepage=V.url(check_exists=True)))
+"""
+
+import sys
+from threading import Lock, Thread, local
+
+from validino.base import Failure, Schema, Validator, _Combinator, as_result
+from validino.extra import Email, Url
+from validino.field import Field
+
+__all__=['Blocking',
+         'ConcurrentCheck',
+         'ConcurrentEither',
+         'ThreadedSchema',
+         'blocking',
+         'concurrent_check',
+         'concurrent_either',
+         'is_blocking',
+         'shutdown']
+
+
+class Blocking(Validator):
+    __slots__=('validator', '_result')
+    _fields=('validator',)
+
+    def __init__(self, validator):
+        self.validator=validator
+        self._result=as_result(validator)
+
+    def result(self, value):
+        return self._result(value)
+
+def blocking(validator):
+    """
+    marks a validator as blocking on I/O, such as a database query,
+    so that ThreadedSchema runs it on a worker thread.  It validates
+    just as the validator does.
+    """
+    return Blocking(validator)
+
+
+def is_blocking(validator):
+    """
+    whether a validator, or any validator within it, blocks on I/O:
+    is marked with blocking(), or is email() with check_dns or url()
+    with check_exists.
+    """
+    seen=set()
+    todo=[validator]
+    while todo:
+        v=todo.pop()
+        if id(v) in seen:
+            continue
+        seen.add(id(v))
+        if isinstance(v, Blocking):
+            return True
+        if isinstance(v, Email) and v.check_dns:
+            return True
+        if isinstance(v, Url) and v.check_exists:
+            return True
+        if isinstance(v, (list, tuple)):
+            todo.extend(v)
+        elif isinstance(v, Schema):
+            todo.extend(v.subvalidators.values())
+        elif isinstance(v, Field):
+            todo.append(v._validator)
+        elif isinstance(v, _Combinator):
+            todo.extend(v.validators)
+    return False
+
+
+def _gather(results, value, catch=False):
+    """
+    applies each of a series of exception-free validators to value at
+    once, the first in the calling thread and each of the others in a
+    thread of its own, and returns their results in order.  Exceptions
+    are turned into Failures if catch is true, and otherwise the first
+    one raised, in validator order, is re-raised.
+    """
+    out=[None] * len(results)
+    errors=[]
+    def run(i):
+        try:
+            out[i]=results[i](value)
+        except Exception, e:
+            if catch:
+                out[i]=Failure.wrap(e)
+            else:
+                errors.append((i, sys.exc_info()))
+    threads=[Thread(target=run, args=(i,)) for i in range(1, len(results))]
+    for t in threads:
+        t.daemon=True
+        t.start()
+    if results:
+        run(0)
+    for t in threads:
+        t.join()
+    if errors:
+        i, (etype, evalue, tb)=min(errors)
+        raise etype, evalue, tb
+    return out
+
+
+class ConcurrentCheck(_Combinator):
+    __slots__=()
+
+    def result(self, value):
+        for res in _gather(self._results, value):
+            if res.__class__ is Failure:
+                return res
+        return value
+
+def concurrent_check(*validators):
+    """
+    like check(), but runs the validators at once, each in a thread of
+    its own, for validators that block on I/O.  If any fail, the
+    failure of the first, in the order given, is returned.
+    """
+    return ConcurrentCheck(*validators)
+
+
+class ConcurrentEither(_Combinator):
+    __slots__=()
+
+    def result(self, value):
+        if not self._results:
+            raise ValueError("concurrent_either() requires at least "
+                             "one validator")
+        for res in _gather(self._results, value, True):
+            if res.__class__ is not Failure:
+                return res
+        return res
+
+def concurrent_either(*validators):
+    """
+    like either(), but runs the validators at once, each in a thread
+    of its own, for validators that block on I/O, and returns the
+    result of the first, in the order given, that works.  All of them
+    are run, even when an earlier one works.
+    """
+    return ConcurrentEither(*validators)
+
+
+def _apply(vfunc, value):
+    try:
+        return vfunc(value)
+    except Exception, e:
+        return Failure.wrap(e)
+
+_skipped=object()
+
+
+# the worker threads shared by all ThreadedSchemas, started on first
+# use; pool_size may be changed before then, or after shutdown().
+pool_size=10
+_pool=None
+_pool_lock=Lock()
+_worker=local()
+
+def _get_pool():
+    global _pool
+    _pool_lock.acquire()
+    try:
+        if _pool is None:
+            # imported here, so that validino doesn't need
+            # multiprocessing unless this is used
+            from multiprocessing.pool import ThreadPool
+            _pool=ThreadPool(pool_size)
+        return _pool
+    finally:
+        _pool_lock.release()
+
+def _apply_pooled(vfunc, value):
+    _worker.pooled=True
+    return _apply(vfunc, value)
+
+def shutdown():
+    """
+    stops the worker threads shared by ThreadedSchemas, once they have
+    finished their work; they are started again if needed.
+    """
+    global _pool
+    _pool_lock.acquire()
+    try:
+        pool=_pool
+        _pool=None
+    finally:
+        _pool_lock.release()
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+
+class ThreadedSchema(Schema):
+    """
+    like Schema, but the blocking steps (see is_blocking()) of each
+    level of its dependency graph (see Schema.levels()) are run
+    concurrently on a pool of pool_size worker threads, shared by all
+    ThreadedSchemas, while its other steps run in the calling thread.
+    A step with a plural key still waits for the steps it depends on,
+    and is passed their converted values, so the converted dictionary
+    and the errors are the same as Schema's.
+
+    A ThreadedSchema used within a step already running on the pool
+    runs all its steps in that thread, so that the pool's threads
+    never wait on each other.
+    """
+
+    def _compile(self):
+        """
+        builds the plan, as Schema._compile() does, and the levels to
+        run it in, as tuples of (plan index, is blocking) pairs.
+        """
+        Schema._compile(self)
+        index=dict([(step[0], i) for i, step in enumerate(self._plan)])
+        self._levels=tuple([
+            tuple([(index[k], is_blocking(self._subvalidators[k]))
+                   for k in keys])
+            for keys in self.levels()])
+
+    def __getstate__(self):
+        state=Schema.__getstate__(self)
+        del state['_levels']
+        return state
+
+    def result(self, data):
+        """
+        validates data in exception-free mode, returning either the
+        converted dictionary or a Failure, as Schema.result() does.
+        """
+        if not (self.allow_extra and self.allow_missing):
+            failure=self._check_keys(data)
+            if failure is not None:
+                return failure
+
+        steps=self._steps()
+        outcomes=[_skipped] * len(steps)
+        res={}
+        skip=self.skip_failed
+        failed=set()
+        pool=None
+        pooled=not getattr(_worker, 'pooled', False)
+        for level in self._levels:
+            pending=[]
+            inline=[]
+            for i, blocking in level:
+                k, vfunc, have_plural=steps[i]
+                if have_plural:
+                    if skip and failed and failed.intersection(k):
+                        failed.update(k)
+                        continue
+                    vdata=tuple([res.get(x, data.get(x)) for x in k])
+                else:
+                    vdata=res.get(k, data.get(k))
+                if blocking and pooled:
+                    if pool is None:
+                        pool=_get_pool()
+                    pending.append((i, pool.apply_async(_apply_pooled,
+                                                        (vfunc, vdata))))
+                else:
+                    inline.append((i, vfunc, vdata))
+            for i, vfunc, vdata in inline:
+                outcomes[i]=_apply(vfunc, vdata)
+            for i, r in pending:
+                outcomes[i]=r.get()
+            # steps of one level share no keys, so the order in which
+            # their values are stored doesn't matter
+            for i, blocking in level:
+                tmp=outcomes[i]
+                if tmp is _skipped:
+                    continue
+                k, vfunc, have_plural=steps[i]
+                if tmp.__class__ is Failure:
+                    if skip and not have_plural:
+                        failed.add(k)
+                elif have_plural:
+                    res.update(zip(k, tmp))
+                else:
+                    res[k]=tmp
+
+        # errors are gathered in plan order, as Schema does
+        failures={}
+        for step, tmp in zip(steps, outcomes):
+            if tmp.__class__ is Failure:
+                name=tmp.field or step[0]
+                failures.setdefault(name, [])
+                failures[name].append(tmp)
+        if failures:
+            m=self._message("schema.error",
+                            "Problems were found in the submitted data.")
+            return Failure(m, failures, key='schema.error')
+        return res
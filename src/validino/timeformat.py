@@ -0,0 +1,175 @@
+"""
+Compiled time format parsers.
+
+compile_format() turns a time.strptime format string into a parser
+that returns the same struct_time strptime would, or raises
+ValueError where strptime would.  Formats made up only of the numeric
+directives %Y, %y, %m, %d, %H, %M and %S (which covers ISO 8601 dates
+and times and the formats used by DateField, DateTimeField and
+TimeField) are handled with a single regular expression match;
+values in their canonical fixed-width form, like '2007-03-04' or
+'03/04/2007 12:30', are matched by a simpler pattern still.  Formats
+with other directives are passed through to time.strptime.
+"""
+
+import datetime
+import re
+import time
+
+from validino.util import LRUCache
+
+__all__=['compile_format',
+         'TimeFormat']
+
+# directive -> (strptime's pattern, the pattern for its canonical
+#               two- or four-digit form, slot in the time tuple)
+_directives={
+    'Y' : (r'\d\d\d\d', '([0-9]{4})', 0),
+    'y' : (r'\d\d', '([0-9]{2})', 0),
+    'm' : (r'1[0-2]|0[1-9]|[1-9]', '(0[1-9]|1[0-2])', 1),
+    'd' : (r'3[01]|[12]\d|0[1-9]|[1-9]| [1-9]', '(0[1-9]|[12][0-9]|3[01])', 2),
+    'H' : (r'2[0-3]|[0-1]\d|\d', '([01][0-9]|2[0-3])', 3),
+    'M' : (r'[0-5]\d|\d', '([0-5][0-9])', 4),
+    'S' : (r'6[0-1]|[0-5]\d|\d', '([0-5][0-9]|6[01])', 5),
+    }
+
+_whitespaceRE=re.compile(r'(\s+)')
+
+
+def _tokenize(format):
+    """
+    splits a format into a list of ('lit', text) and ('dir', directive)
+    tokens, or returns None if it uses anything but the directives
+    handled here.
+    """
+    tokens=[]
+    lit=[]
+    i=0
+    n=len(format)
+    while i < n:
+        c=format[i]
+        if c!='%':
+            lit.append(c)
+            i+=1
+            continue
+        if i+1==n:
+            return None
+        d=format[i+1]
+        i+=2
+        if d=='%':
+            lit.append('%')
+            continue
+        if d not in _directives:
+            return None
+        if lit:
+            tokens.append(('lit', ''.join(lit)))
+            lit=[]
+        tokens.append(('dir', d))
+    if lit:
+        tokens.append(('lit', ''.join(lit)))
+    return tokens
+
+
+def _literal_pattern(text):
+    parts=_whitespaceRE.split(text)
+    return ''.join([(i % 2 and r'\s+' or re.escape(p))
+                    for i, p in enumerate(parts)])
+
+
+class TimeFormat(object):
+    """
+    a parser for a single time format.
+    """
+
+    def __init__(self, format):
+        self.format=format
+        self.directives=None
+        tokens=None
+        if isinstance(format, basestring):
+            tokens=_tokenize(format)
+        if tokens is None:
+            return
+        directives=[t for kind, t in tokens if kind=='dir']
+        slots=[_directives[d][2] for d in directives]
+        if len(set(slots)) < len(slots):
+            # strptime lets the last of two directives for the same
+            # field win, or fails; leave such formats to it.
+            return
+        self.directives=tuple(directives)
+        self._slots=tuple(slots)
+        self._twodigit='y' in directives
+        pattern=[]
+        fixed=[]
+        for kind, t in tokens:
+            if kind=='lit':
+                pattern.append(_literal_pattern(t))
+                fixed.append(re.escape(t))
+            else:
+                pattern.append('(%s)' % _directives[t][0])
+                fixed.append(_directives[t][1])
+        self._pattern=re.compile(''.join(pattern), re.IGNORECASE)
+        self._fixed=re.compile(''.join(fixed) + r'\Z')
+
+    def _fields(self, value):
+        """
+        returns the year, month, day, hour, minute and second in value.
+        """
+        m=self._fixed.match(value)
+        if m is None:
+            m=self._pattern.match(value)
+            if m is None or m.end()!=len(value):
+                raise ValueError("time data %r does not match format %r"
+                                 % (value, self.format))
+        tm=[1900, 1, 1, 0, 0, 0]
+        for slot, n in zip(self._slots, m.groups()):
+            tm[slot]=int(n)
+        if self._twodigit:
+            if tm[0] <= 68:
+                tm[0]+=2000
+            else:
+                tm[0]+=1900
+        return tm
+
+    def parse(self, value):
+        """
+        parses value as time.strptime(value, format) would.
+        """
+        if self.directives is None:
+            return time.strptime(value, self.format)
+        tm=self._fields(value)
+        date=datetime.date(tm[0], tm[1], tm[2])
+        yday=date.toordinal() - datetime.date(tm[0], 1, 1).toordinal() + 1
+        return time.struct_time(tm + [date.weekday(), yday, -1])
+
+    __call__=parse
+
+    def date(self, value):
+        """
+        like parse, but returns a datetime.date object.
+        """
+        if self.directives is None:
+            return datetime.date(*time.strptime(value, self.format)[:3])
+        tm=self._fields(value)
+        return datetime.date(tm[0], tm[1], tm[2])
+
+    def datetime(self, value):
+        """
+        like parse, but returns a datetime.datetime object.
+        """
+        if self.directives is None:
+            return datetime.datetime(*time.strptime(value, self.format)[:6])
+        return datetime.datetime(*self._fields(value))
+
+
+_format_cache=LRUCache(256)
+
+def compile_format(format):
+    """
+    returns a TimeFormat for the given format, shared with other
+    callers asking for the same one.
+    """
+    try:
+        return _format_cache.lookup(format, TimeFormat)
+    except TypeError:
+        # unhashable; strptime will complain about it
+        return TimeFormat(format)
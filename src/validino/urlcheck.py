@@ -0,0 +1,178 @@
+"""
+Checking that urls exist, for the url validator's check_exists option.
+
+A UrlChecker sends HEAD requests over keep-alive connections that it
+pools per host, with separate connect and read timeouts, and
+remembers the status returned for each url for a while.
+check_many() checks a batch of urls with several requests in flight
+at once.
+"""
+
+import httplib
+import socket
+import time
+import urlparse
+from threading import Lock
+
+from validino.util import DefaultInstance, LRUCache, thread_map
+
+__all__=['UrlCheckError',
+         'UrlChecker',
+         'get_default_checker',
+         'set_default_checker']
+
+
+class UrlCheckError(Exception):
+    pass
+
+
+class UrlChecker(object):
+    """
+    sends HEAD requests to http and https urls and returns the status.
+    Statuses are remembered for ttl seconds, for up to maxsize urls;
+    failed requests are not remembered.  Up to max_idle idle
+    connections are kept open per host for reuse.
+    """
+
+    def __init__(self,
+                 connect_timeout=5,
+                 read_timeout=10,
+                 ttl=300,
+                 maxsize=10000,
+                 max_idle=4):
+        self.connect_timeout=connect_timeout
+        self.read_timeout=read_timeout
+        self.ttl=ttl
+        self.max_idle=max_idle
+        self._cache=LRUCache(maxsize)
+        self._idle={}
+        self._lock=Lock()
+        self.connections_made=0
+
+    @staticmethod
+    def _normalize(url):
+        scheme, netloc, path, params, query, fragment=urlparse.urlparse(url)
+        return urlparse.urlunparse((scheme.lower(),
+                                    netloc.lower(),
+                                    path or '/',
+                                    params,
+                                    query,
+                                    ''))
+
+    def _connect(self, scheme, netloc):
+        if scheme=='http':
+            conn=httplib.HTTPConnection(netloc, timeout=self.connect_timeout)
+        elif scheme=='https':
+            conn=httplib.HTTPSConnection(netloc, timeout=self.connect_timeout)
+        else:
+            raise ValueError("unsupported scheme: %s" % scheme)
+        conn.connect()
+        conn.sock.settimeout(self.read_timeout)
+        self._lock.acquire()
+        try:
+            self.connections_made+=1
+        finally:
+            self._lock.release()
+        return conn
+
+    def _checkout(self, host):
+        self._lock.acquire()
+        try:
+            idle=self._idle.get(host)
+            if idle:
+                return idle.pop()
+        finally:
+            self._lock.release()
+        return None
+
+    def _checkin(self, host, conn):
+        self._lock.acquire()
+        try:
+            idle=self._idle.setdefault(host, [])
+            if len(idle) < self.max_idle:
+                idle.append(conn)
+                return
+        finally:
+            self._lock.release()
+        conn.close()
+
+    def _head(self, url):
+        scheme, netloc, path, params, query, fragment=urlparse.urlparse(url)
+        host=(scheme, netloc)
+        path=urlparse.urlunparse(('', '', path, params, query, ''))
+        conn=self._checkout(host)
+        # an idle connection may have been closed by the server in
+        # the meantime, in which case the request is retried once on
+        # a fresh one.
+        for reused in (conn is not None, False):
+            if conn is None:
+                conn=self._connect(scheme, netloc)
+            try:
+                conn.request('HEAD', path)
+                res=conn.getresponse()
+                res.read()
+            except (httplib.HTTPException, socket.error):
+                conn.close()
+                conn=None
+                if reused:
+                    continue
+                raise
+            if res.will_close:
+                conn.close()
+            else:
+                self._checkin(host, conn)
+            return res.status
+
+    def _lookup(self, url):
+        try:
+            status=self._head(url)
+        except (httplib.HTTPException, socket.error), e:
+            raise UrlCheckError(str(e))
+        return time.time() + self.ttl, status
+
+    def status(self, url):
+        """
+        returns the status of a HEAD request for url, raising
+        UrlCheckError if the request fails.
+        """
+        return self._cache.lookup_expiring(self._normalize(url), self._lookup)
+
+    def check_many(self, urls, concurrency=10):
+        """
+        gets the status of each of the given urls, with up to
+        concurrency requests in flight at once, and returns a
+        dictionary mapping each url to its status, or to the
+        UrlCheckError raised for it.
+        """
+        def check(url):
+            try:
+                return url, self.status(url)
+            except UrlCheckError, e:
+                return url, e
+        return dict(thread_map(check, set(urls), concurrency))
+
+    def close(self):
+        """
+        closes all idle connections.
+        """
+        self._lock.acquire()
+        try:
+            idle, self._idle=self._idle, {}
+        finally:
+            self._lock.release()
+        for conns in idle.itervalues():
+            for conn in conns:
+                conn.close()
+
+
+_default_checker=DefaultInstance(UrlChecker)
+
+def get_default_checker():
+    """
+    returns the checker used by url validators that weren't given
+    one, creating it on first use unless another has been set.
+    """
+    return _default_checker.get()
+
+def set_default_checker(checker):
+    _default_checker.set(checker)
@@ -8,3 +8,137 @@ except ImportError:
             return func(*(args + _args), **d)
         return inner
 
+
+import time
+
+try:
+    from threading import Lock
+except ImportError:
+    from dummy_threading import Lock
+
+
+class LRUCache(object):
+    """
+    a small, thread-safe mapping of bounded size that discards the
+    least recently used entry when it is full, and counts hits and
+    misses.
+    """
+    def __init__(self, maxsize=128):
+        self.maxsize=maxsize
+        self.hits=0
+        self.misses=0
+        self._data={}
+        self._tick=0
+        self._lock=Lock()
+
+    def lookup(self, key, create):
+        """
+        returns the value cached for key, calling create(key) to make
+        (and cache) it if necessary.
+        """
+        self._lock.acquire()
+        try:
+            self._tick+=1
+            try:
+                entry=self._data[key]
+            except KeyError:
+                self.misses+=1
+            else:
+                self.hits+=1
+                entry[1]=self._tick
+                return entry[0]
+        finally:
+            self._lock.release()
+        # create outside the lock; a concurrent miss on the same key
+        # may create the value twice, which is harmless.
+        value=create(key)
+        self._lock.acquire()
+        try:
+            if key not in self._data and len(self._data)>=self.maxsize:
+                # eviction only happens on a miss, so a linear scan
+                # for the oldest entry is cheap by comparison.
+                oldest=min(self._data.iteritems(), key=lambda x: x[1][1])
+                del self._data[oldest[0]]
+            self._data[key]=[value, self._tick]
+        finally:
+            self._lock.release()
+        return value
+
+    def lookup_expiring(self, key, create):
+        """
+        like lookup(), but create(key) returns an (expires, value)
+        pair, where expires is a time.time() timestamp after which the
+        value is stale and is made afresh.  Only the value is returned.
+        """
+        expires, value=self.lookup(key, create)
+        if expires < time.time():
+            self.discard(key)
+            expires, value=self.lookup(key, create)
+        return value
+
+    def discard(self, key):
+        self._lock.acquire()
+        try:
+            self._data.pop(key, None)
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self._data.clear()
+            self.hits=self.misses=0
+        finally:
+            self._lock.release()
+
+    def info(self):
+        return dict(hits=self.hits,
+                    misses=self.misses,
+                    size=len(self._data),
+                    maxsize=self.maxsize)
+
+    def __len__(self):
+        return len(self._data)
+
+
+def thread_map(func, items, concurrency=10):
+    """
+    applies func to each of items, with up to concurrency calls
+    running at once in threads, and returns the results in order.
+    """
+    items=list(items)
+    if not items:
+        return []
+    # imported here, so that validino doesn't need multiprocessing
+    # unless this is used
+    from multiprocessing.pool import ThreadPool
+    pool=ThreadPool(min(concurrency, len(items)))
+    try:
+        return pool.map(func, items)
+    finally:
+        pool.close()
+        pool.join()
+
+
+class DefaultInstance(object):
+    """
+    holds a module's default instance of something, made by calling
+    factory on first use unless another has been set.
+    """
+    def __init__(self, factory):
+        self.factory=factory
+        self._value=None
+        self._lock=Lock()
+
+    def get(self):
+        if self._value is None:
+            self._lock.acquire()
+            try:
+                if self._value is None:
+                    self._value=self.factory()
+            finally:
+                self._lock.release()
+        return self._value
+
+    def set(self, value):
+        self._value=value